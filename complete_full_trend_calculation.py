@@ -107,11 +107,12 @@ def process_timeframe_complete(interval_minutes, interval_name):
                 cur.execute(update_query, values)
                 updated += 1
             
-            conn.commit()
-            
             if updated % 1000 == 0:
                 logger.info(f"  Updated {updated}/{len(df)} rows...")
         
+        # Single commit; any failure rolls back the whole interval
+        conn.commit()
+        
         logger.info(f"✓ Completed {interval_name}: Updated {updated} rows")
         
     except Exception as e:
@@ -1227,6 +1227,7 @@ def start_trend_calculation():
             ]
             
             total_updated = 0
+            pending = []
             
             for interval, name in timeframes:
                 # Count records with missing trends
@@ -1246,16 +1247,7 @@ def start_trend_calculation():
                         'level': 'info',
                         'message': f'Processing {name}: {missing_count} records need trends'
                     })
-                    
-                    # Update trends only for records with NULL trends
-                    updated = detector.update_missing_trends('15380', interval)
-                    total_updated += updated
-                    
-                    update_progress({
-                        'timestamp': datetime.now().isoformat(),
-                        'level': 'success',
-                        'message': f'{name}: Updated {updated} records'
-                    })
+                    pending.append((interval, name))
                 else:
                     update_progress({
                         'timestamp': datetime.now().isoformat(),
@@ -1263,6 +1255,19 @@ def start_trend_calculation():
                         'message': f'{name}: All records have trends'
                     })
             
+            if pending:
+                # Update trends only for records with NULL trends, all timeframes in one backfill
+                updated = detector.update_missing_trends_many(
+                    [('15380', interval) for interval, _ in pending])
+                
+                for interval, name in pending:
+                    total_updated += updated[('15380', interval)]
+                    update_progress({
+                        'timestamp': datetime.now().isoformat(),
+                        'level': 'success',
+                        'message': f'{name}: Updated {updated[("15380", interval)]} records'
+                    })
+            
             # Process daily data
             cur.execute("""
                 SELECT COUNT(*) 
@@ -66,6 +66,14 @@ CREATE INDEX idx_recommendations_security_id ON dhanhq.trading_recommendations(s
 CREATE INDEX idx_recommendations_generated_at ON dhanhq.trading_recommendations(generated_at DESC);
 CREATE INDEX idx_recommendations_symbol ON dhanhq.trading_recommendations(symbol);
 
+-- Cache of GPT validations keyed by a hash of the formatted recommendation text
+CREATE TABLE IF NOT EXISTS dhanhq.gpt_validation_cache (
+    cache_key CHAR(32) PRIMARY KEY, -- blake2b-128 hex digest
+    score INTEGER,
+    full_validation TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create trigger to update updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -36,8 +36,13 @@ ON dhanhq.price_data(security_id, datetime DESC);
 CREATE INDEX IF NOT EXISTS idx_price_data_datetime 
 ON dhanhq.price_data(datetime DESC);
 
-CREATE INDEX IF NOT EXISTS idx_price_data_security_interval 
-ON dhanhq.price_data(security_id, interval_minutes);
+-- Serves MAX(datetime) lookups per security/interval without scanning the
+-- whole interval; its (security_id, interval_minutes) prefix replaces the
+-- narrower index that used to exist
+DROP INDEX IF EXISTS dhanhq.idx_price_data_security_interval;
+
+CREATE INDEX IF NOT EXISTS idx_price_data_security_interval_datetime 
+ON dhanhq.price_data(security_id, interval_minutes, datetime DESC);
 
 CREATE INDEX IF NOT EXISTS idx_securities_symbol 
 ON dhanhq.securities(symbol);
@@ -59,11 +64,95 @@ CREATE TABLE IF NOT EXISTS dhanhq.download_history (
 CREATE INDEX IF NOT EXISTS idx_download_history_security 
 ON dhanhq.download_history(security_id, created_at DESC);
 
+-- Ingest watermark (last ingested timestamp per security and interval)
+CREATE TABLE IF NOT EXISTS dhanhq.ingest_watermark (
+    security_id VARCHAR(50) NOT NULL,
+    interval_key VARCHAR(20) NOT NULL,  -- '1', '5', '15', '60', 'daily', 'weekly', 'monthly'
+    last_ts TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (security_id, interval_key)
+);
+
+-- Per-security price data summary, maintained by trg_price_data_summary
+CREATE TABLE IF NOT EXISTS dhanhq.security_summary (
+    security_id VARCHAR(50) PRIMARY KEY,
+    total_records BIGINT NOT NULL,
+    first_date TIMESTAMP WITH TIME ZONE,
+    last_date TIMESTAMP WITH TIME ZONE,
+    trading_days INT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Fold the rows each statement actually inserted into security_summary.
+-- Bars overwritten by ON CONFLICT DO UPDATE are not in the transition table,
+-- so re-fetched bars are never counted twice.
+CREATE OR REPLACE FUNCTION dhanhq.update_security_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Serialize per security so concurrent loads agree on which days are new
+    PERFORM pg_advisory_xact_lock(hashtext('security_summary:' || security_id))
+    FROM (SELECT DISTINCT security_id FROM inserted ORDER BY security_id) ids;
+
+    INSERT INTO dhanhq.security_summary AS s
+    (security_id, total_records, first_date, last_date, trading_days)
+    SELECT batch.security_id, batch.records, batch.first_date, batch.last_date, COALESCE(days.new_days, 0)
+    FROM (
+        SELECT security_id, COUNT(*) AS records, MIN(datetime) AS first_date, MAX(datetime) AS last_date
+        FROM inserted
+        GROUP BY security_id
+    ) batch
+    LEFT JOIN (
+        -- A trading day is new when all of its stored bars came from this statement
+        SELECT d.security_id, COUNT(*) AS new_days
+        FROM (
+            SELECT security_id, DATE(datetime AT TIME ZONE 'Asia/Kolkata') AS trading_date, COUNT(*) AS bars
+            FROM inserted
+            GROUP BY 1, 2
+        ) d
+        WHERE d.bars = (
+            SELECT COUNT(*)
+            FROM dhanhq.price_data p
+            WHERE p.security_id = d.security_id
+            AND p.datetime >= d.trading_date::timestamp AT TIME ZONE 'Asia/Kolkata'
+            AND p.datetime < (d.trading_date + 1)::timestamp AT TIME ZONE 'Asia/Kolkata'
+        )
+        GROUP BY d.security_id
+    ) days ON days.security_id = batch.security_id
+    ON CONFLICT (security_id)
+    DO UPDATE SET
+        total_records = s.total_records + EXCLUDED.total_records,
+        first_date = LEAST(s.first_date, EXCLUDED.first_date),
+        last_date = GREATEST(s.last_date, EXCLUDED.last_date),
+        trading_days = s.trading_days + EXCLUDED.trading_days,
+        updated_at = CURRENT_TIMESTAMP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_price_data_summary ON dhanhq.price_data;
+CREATE TRIGGER trg_price_data_summary
+    AFTER INSERT ON dhanhq.price_data
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dhanhq.update_security_summary();
+
+-- One-time backfill for bars stored before the trigger existed; creating the
+-- trigger locks out concurrent inserts until this script commits
+INSERT INTO dhanhq.security_summary
+(security_id, total_records, first_date, last_date, trading_days)
+SELECT security_id, COUNT(*), MIN(datetime), MAX(datetime), COUNT(DISTINCT DATE(datetime AT TIME ZONE 'Asia/Kolkata'))
+FROM dhanhq.price_data
+GROUP BY security_id
+ON CONFLICT (security_id) DO NOTHING;
+
 -- Add comments
 COMMENT ON SCHEMA dhanhq IS 'Schema for DhanHQ market data';
 COMMENT ON TABLE dhanhq.securities IS 'Master table for securities/instruments';
 COMMENT ON TABLE dhanhq.price_data IS 'Historical price data in IST timezone';
 COMMENT ON TABLE dhanhq.download_history IS 'Track data download attempts and status';
+COMMENT ON TABLE dhanhq.ingest_watermark IS 'Last ingested timestamp per security and interval';
+COMMENT ON TABLE dhanhq.security_summary IS 'Price data summary per security, maintained by trg_price_data_summary';
 
 COMMENT ON COLUMN dhanhq.price_data.datetime IS 'Timestamp in IST (Asia/Kolkata) timezone';
 COMMENT ON COLUMN dhanhq.price_data.interval_minutes IS 'Time interval: 1, 5, 15, 25, or 60 minutes';
\ No newline at end of file
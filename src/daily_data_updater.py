@@ -13,10 +13,125 @@ from datetime import datetime, timedelta, date
 from dotenv import load_dotenv
 import logging
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib decoder
+    orjson = None
+
+try:
+    import requests_cache
+except ImportError:  # requests-cache is optional; fall back to an uncached session
+    requests_cache = None
 
 load_dotenv()
 
+# DhanHQ intervals whose responses may be reused from the HTTP cache; intraday
+# bars change within the cache expiry, so those requests always go out
+CACHEABLE_INTERVALS = ('D', 'W', 'M')
+
+# Table-specific SQL for each interval, built once at import time.
+# Intraday intervals (1, 5, 15, 60) share the 'intraday' entry and are
+# distinguished by the interval_minutes column.
+INTERVAL_CONFIG = {
+    'daily': {
+        'table': 'price_data_daily',
+        'per_interval': False,
+        'select_sql': """
+            SELECT MAX(date) 
+            FROM dhanhq.price_data_daily
+            WHERE security_id = %s
+        """,
+        'insert_sql': """
+            INSERT INTO dhanhq.price_data_daily 
+            (security_id, date, open, high, low, close, volume)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (security_id, date) DO NOTHING
+        """
+    },
+    'weekly': {
+        'table': 'price_data_weekly',
+        'per_interval': False,
+        'select_sql': """
+            SELECT MAX(date) 
+            FROM dhanhq.price_data_weekly
+            WHERE security_id = %s
+        """,
+        'insert_sql': """
+            INSERT INTO dhanhq.price_data_weekly 
+            (security_id, date, open, high, low, close, volume)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (security_id, date) DO NOTHING
+        """
+    },
+    'monthly': {
+        'table': 'price_data_monthly',
+        'per_interval': False,
+        'select_sql': """
+            SELECT MAX(date) 
+            FROM dhanhq.price_data_monthly
+            WHERE security_id = %s
+        """,
+        'insert_sql': """
+            INSERT INTO dhanhq.price_data_monthly 
+            (security_id, date, open, high, low, close, volume)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (security_id, date) DO NOTHING
+        """
+    },
+    'intraday': {
+        'table': 'price_data',
+        'per_interval': True,
+        'select_sql': """
+            SELECT MAX(datetime) 
+            FROM dhanhq.price_data
+            WHERE security_id = %s AND interval_minutes = %s
+        """,
+        'insert_sql': """
+            INSERT INTO dhanhq.price_data 
+            (security_id, interval_minutes, datetime, open, high, low, close, volume)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (security_id, interval_minutes, datetime) DO NOTHING
+        """
+    }
+}
+
+# Per-interval high-water mark of ingested data, so warm runs only fetch the
+# unsettled tail instead of re-deriving it with MAX() over the price tables
+WATERMARK_SELECT_SQL = """
+    SELECT interval_key, last_ts
+    FROM dhanhq.ingest_watermark
+    WHERE security_id = %s
+"""
+
+WATERMARK_UPSERT_SQL = """
+    INSERT INTO dhanhq.ingest_watermark (security_id, interval_key, last_ts)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (security_id, interval_key)
+    DO UPDATE SET last_ts = GREATEST(EXCLUDED.last_ts, ingest_watermark.last_ts)
+"""
+
+# Smallest gap after the last stored bar that can contain a new bar
+MIN_BAR_GAP = {
+    1: timedelta(minutes=1),
+    5: timedelta(minutes=5),
+    15: timedelta(minutes=15),
+    60: timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=28)
+}
+
+def to_naive_datetime(value):
+    """Normalise a date/datetime (naive or tz-aware) to a naive datetime, keeping wall-clock time"""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.to_pydatetime()
+
 class DailyDataUpdater:
     def __init__(self, progress_callback=None):
         """Initialize the daily data updater
@@ -31,6 +146,11 @@ class DailyDataUpdater:
         # Setup logging
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
+        self.log_methods = {
+            'info': self.logger.info,
+            'error': self.logger.error,
+            'warning': self.logger.warning
+        }
         
         # Database connection parameters
         self.db_params = {
@@ -41,17 +161,60 @@ class DailyDataUpdater:
             'password': os.getenv('DB_PASSWORD')
         }
         
+        # DB_SOCKET_DIR (e.g. /var/run/postgresql) opts in to the local UNIX
+        # domain socket; TCP connections are kept alive and bound stalled sends
+        socket_dir = os.getenv('DB_SOCKET_DIR')
+        if socket_dir:
+            self.db_params['host'] = socket_dir
+        else:
+            self.db_params.update({
+                'keepalives': 1,
+                'keepalives_idle': 30,
+                'tcp_user_timeout': 10000
+            })
+        
         # Security ID for MANKIND
         self.security_id = '15380'
         
+        # HTTP session: short-lived response cache for overlapping reruns and
+        # exponential backoff on rate limiting / transient server errors
+        self.session = self.create_http_session()
+        
+        # Watermarks keyed by interval (loaded once per run_daily_update)
+        self.watermarks = {}
+        
+    def create_http_session(self):
+        """Create HTTP session with response caching and retry/backoff"""
+        if requests_cache:
+            session = requests_cache.CachedSession(
+                'dhan_api_cache', backend='sqlite', use_temp=True, expire_after=60,
+                allowable_methods=('GET',), filter_fn=self.is_cacheable
+            )
+        else:
+            session = requests.Session()
+        
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=['GET'],
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def is_cacheable(self, response):
+        """Only cache daily, weekly and monthly history responses"""
+        interval = parse_qs(urlparse(response.url).query).get('interval', [''])[0]
+        return interval in CACHEABLE_INTERVALS
+    
     def log_progress(self, message, level='info'):
         """Log progress and call callback if provided"""
-        if level == 'info':
-            self.logger.info(message)
-        elif level == 'error':
-            self.logger.error(message)
-        elif level == 'warning':
-            self.logger.warning(message)
+        log = self.log_methods.get(level)
+        if log:
+            log(message)
             
         if self.progress_callback:
             self.progress_callback({
@@ -64,57 +227,53 @@ class DailyDataUpdater:
         """Create database connection"""
         return psycopg2.connect(**self.db_params)
     
-    def get_last_timestamp(self, interval_minutes):
-        """Get the last timestamp in database for given interval"""
+    def get_watermarks(self, intervals=()):
+        """Get the last ingested timestamp of every interval in one round trip
+        
+        Intervals in `intervals` that have no watermark yet (first run after
+        upgrade) are derived from MAX() over their price tables, folded into a
+        single row of scalar subqueries on the same cursor.
+        """
         conn = self.get_db_connection()
-        cur = conn.cursor()
         
         try:
-            # Determine table and column based on interval
-            if interval_minutes == 'daily':
-                table = 'price_data_daily'
-                date_column = 'date'
-                query = f"""
-                    SELECT MAX({date_column}) 
-                    FROM dhanhq.{table}
-                    WHERE security_id = %s
-                """
-                cur.execute(query, (self.security_id,))
-            elif interval_minutes == 'weekly':
-                table = 'price_data_weekly'
-                date_column = 'date'
-                query = f"""
-                    SELECT MAX({date_column}) 
-                    FROM dhanhq.{table}
-                    WHERE security_id = %s
-                """
-                cur.execute(query, (self.security_id,))
-            elif interval_minutes == 'monthly':
-                table = 'price_data_monthly'
-                date_column = 'date'
-                query = f"""
-                    SELECT MAX({date_column}) 
-                    FROM dhanhq.{table}
-                    WHERE security_id = %s
-                """
-                cur.execute(query, (self.security_id,))
-            else:
-                query = """
-                    SELECT MAX(datetime) 
-                    FROM dhanhq.price_data
-                    WHERE security_id = %s AND interval_minutes = %s
-                """
-                cur.execute(query, (self.security_id, interval_minutes))
-            
-            result = cur.fetchone()
-            last_timestamp = result[0] if result and result[0] else None
-            
-            return last_timestamp
+            with conn.cursor() as cur:
+                cur.execute(WATERMARK_SELECT_SQL, (self.security_id,))
+                watermarks = {interval_key: to_naive_datetime(last_ts)
+                              for interval_key, last_ts in cur.fetchall()}
+                
+                missing = [interval for interval in intervals if str(interval) not in watermarks]
+                if missing:
+                    subqueries = []
+                    params = []
+                    for interval in missing:
+                        cfg = INTERVAL_CONFIG.get(interval, INTERVAL_CONFIG['intraday'])
+                        subqueries.append(f"({cfg['select_sql']})")
+                        params.append(self.security_id)
+                        if cfg['per_interval']:
+                            params.append(interval)
+                    
+                    cur.execute("SELECT " + ", ".join(subqueries), params)
+                    for interval, last_ts in zip(missing, cur.fetchone()):
+                        if last_ts:
+                            watermarks[str(interval)] = to_naive_datetime(last_ts)
             
+            return watermarks
         finally:
-            cur.close()
             conn.close()
     
+    def get_last_timestamp(self, interval_minutes):
+        """Get the last timestamp in database for given interval"""
+        watermark = self.watermarks.get(str(interval_minutes))
+        if watermark:
+            return watermark
+        
+        # Remember the lookup so later misses skip the round trip; entries
+        # already held may be newer than the database's
+        for key, last_ts in self.get_watermarks([interval_minutes]).items():
+            self.watermarks.setdefault(key, last_ts)
+        return self.watermarks.get(str(interval_minutes))
+    
     def fetch_historical_data(self, interval, from_date, to_date):
         """Fetch historical data from DhanHQ API"""
         url = "https://api.dhan.co/charts/historical"
@@ -146,25 +305,33 @@ class DailyDataUpdater:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self.session.get(url, headers=headers, params=params)
             response.raise_for_status()
             
-            data = response.json()
+            data = orjson.loads(response.content) if orjson else response.json()
             
             if 'data' in data and 'candles' in data['data']:
                 candles = data['data']['candles']
-                
-                # Convert to DataFrame
-                df = pd.DataFrame(candles, columns=[
-                    'timestamp', 'open', 'high', 'low', 'close', 'volume'
-                ])
-                
+
+                if not candles:
+                    self.log_progress(f"No data returned for interval {interval}", 'warning')
+                    return pd.DataFrame()
+
+                # Candles are [timestamp, open, high, low, close, volume] rows of
+                # numbers; load them into one typed array and slice out columns
+                arr = np.asarray(candles, dtype=np.float64)
+
                 # Convert timestamp to datetime (assuming DhanHQ returns IST timestamps)
                 # Just convert epoch to datetime without any timezone conversions
-                df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
-                
-                df = df.drop('timestamp', axis=1)
-                
+                df = pd.DataFrame({
+                    'open': arr[:, 1],
+                    'high': arr[:, 2],
+                    'low': arr[:, 3],
+                    'close': arr[:, 4],
+                    'volume': arr[:, 5].astype(np.int64),
+                    'datetime': pd.to_datetime(arr[:, 0].astype(np.int64), unit='s')
+                })
+
                 return df
             else:
                 self.log_progress(f"No data returned for interval {interval}", 'warning')
@@ -184,61 +351,32 @@ class DailyDataUpdater:
         saved_count = 0
         
         try:
-            # Determine table and query based on interval
-            if interval_minutes == 'daily':
-                table = 'price_data_daily'
-                insert_query = f"""
-                    INSERT INTO dhanhq.{table} 
-                    (security_id, date, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, date) DO NOTHING
-                """
-            elif interval_minutes == 'weekly':
-                table = 'price_data_weekly'
-                insert_query = f"""
-                    INSERT INTO dhanhq.{table} 
-                    (security_id, date, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, date) DO NOTHING
-                """
-            elif interval_minutes == 'monthly':
-                table = 'price_data_monthly'
-                insert_query = f"""
-                    INSERT INTO dhanhq.{table} 
-                    (security_id, date, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, date) DO NOTHING
-                """
-            else:
-                insert_query = """
-                    INSERT INTO dhanhq.price_data 
-                    (security_id, interval_minutes, datetime, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, interval_minutes, datetime) DO NOTHING
-                """
+            cfg = INTERVAL_CONFIG.get(interval_minutes, INTERVAL_CONFIG['intraday'])
+            insert_query = cfg['insert_sql']
             
-            # Insert data
-            for _, row in df.iterrows():
-                if interval_minutes in ['daily', 'weekly', 'monthly']:
+            # Insert data - iterate plain tuples instead of per-row Series
+            columns = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+            for dt, open_, high, low, close, volume in df[columns].itertuples(index=False, name=None):
+                if not cfg['per_interval']:
                     values = (
                         self.security_id,
-                        row['datetime'],
-                        float(row['open']),
-                        float(row['high']),
-                        float(row['low']),
-                        float(row['close']),
-                        int(row['volume'])
+                        dt,
+                        float(open_),
+                        float(high),
+                        float(low),
+                        float(close),
+                        int(volume)
                     )
                 else:
                     values = (
                         self.security_id,
                         interval_minutes,
-                        row['datetime'],
-                        float(row['open']),
-                        float(row['high']),
-                        float(row['low']),
-                        float(row['close']),
-                        int(row['volume'])
+                        dt,
+                        float(open_),
+                        float(high),
+                        float(low),
+                        float(close),
+                        int(volume)
                     )
                 
                 cur.execute(insert_query, values)
@@ -246,7 +384,15 @@ class DailyDataUpdater:
                 if cur.rowcount > 0:
                     saved_count += 1
             
+            # Advance the watermark in the same transaction as the insert
+            last_ts = df['datetime'].max().to_pydatetime()
+            cur.execute(WATERMARK_UPSERT_SQL, (self.security_id, str(interval_minutes), last_ts))
+            
             conn.commit()
+            
+            key = str(interval_minutes)
+            if key not in self.watermarks or self.watermarks[key] < last_ts:
+                self.watermarks[key] = last_ts
             return saved_count
             
         except Exception as e:
@@ -275,21 +421,9 @@ class DailyDataUpdater:
         last_timestamp = self.get_last_timestamp(interval)
         
         if last_timestamp:
-            # Remove timezone info if present (keep the time as-is)
-            if hasattr(last_timestamp, 'tzinfo') and last_timestamp.tzinfo is not None:
-                last_timestamp = last_timestamp.replace(tzinfo=None)
-            
             # Add 1 minute/day to avoid duplicate
-            if interval in [1, 5, 15, 60]:
-                from_date = last_timestamp + timedelta(minutes=1)
-            else:
-                # For daily/weekly/monthly, last_timestamp is a date object
-                # Convert it to datetime for consistent comparison
-                if isinstance(last_timestamp, datetime):
-                    from_date = last_timestamp + timedelta(days=1)
-                else:
-                    # Convert date to datetime at start of day
-                    from_date = datetime.combine(last_timestamp, datetime.min.time()) + timedelta(days=1)
+            offset = pd.Timedelta(minutes=1) if interval in (1, 5, 15, 60) else pd.Timedelta(days=1)
+            from_date = (pd.Timestamp(last_timestamp) + offset).to_pydatetime()
             
             self.log_progress(f"Last {interval_name} data: {last_timestamp}")
         else:
@@ -300,8 +434,9 @@ class DailyDataUpdater:
         # To date is current time (no timezone)
         to_date = datetime.now()
         
-        # Check if update needed
-        if from_date >= to_date:
+        # Check if update needed - skip the API call when not even one bar
+        # can have completed since the last stored one
+        if from_date >= to_date or (last_timestamp and to_date - last_timestamp < MIN_BAR_GAP[interval]):
             self.log_progress(f"{interval_name} data is up to date")
             return 0
         
@@ -312,16 +447,9 @@ class DailyDataUpdater:
         if df.empty:
             self.log_progress(f"No new {interval_name} data available")
             return 0
-        
-        # Filter to only new data
-        if last_timestamp:
-            df = df[df['datetime'] > last_timestamp]
-        
-        if df.empty:
-            self.log_progress(f"No new {interval_name} data after filtering")
-            return 0
-        
-        # Save to database
+
+        # Save to database - rows already stored are dropped by ON CONFLICT DO NOTHING,
+        # so the overlapping part of the fetch window needs no client-side filtering
         saved_count = self.save_to_database(df, interval)
         self.log_progress(f"Saved {saved_count} new {interval_name} records")
         
@@ -340,10 +468,12 @@ class DailyDataUpdater:
             # Update each interval
             intervals = [1, 5, 15, 60, 'daily', 'weekly', 'monthly']
             
+            # Load the last timestamp of all intervals in one round trip
+            self.watermarks = self.get_watermarks(intervals)
+            
             for interval in intervals:
                 saved = self.update_single_interval(interval)
                 total_saved += saved
-                time.sleep(0.5)  # Rate limiting
             
             elapsed = datetime.now() - start_time
             
@@ -7,17 +7,107 @@ Maintains IST timezone consistency with existing data
 
 import os
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta, date
 from dotenv import load_dotenv
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import time
 import json
+import io
+import csv
+import itertools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib decoder
+    orjson = None
 
 load_dotenv()
 
+# Row count above which save_to_database switches from execute_values to COPY
+COPY_THRESHOLD = 500
+
+# Insert statements by table, each prepared on a connection the first time it
+# writes that table. Columns are passed as arrays and expanded with unnest(), so
+# Postgres parses/plans each statement only once per session and a batch of any
+# size is a single EXECUTE.
+PREPARED_INSERTS = {
+    'price_data_daily': """
+    PREPARE ins_price_data_daily (varchar, date[], numeric[], numeric[], numeric[], numeric[], bigint[]) AS
+    INSERT INTO dhanhq.price_data_daily (security_id, date, open, high, low, close, volume)
+    SELECT $1, t.* FROM unnest($2, $3, $4, $5, $6, $7) AS t
+    ON CONFLICT (security_id, date) DO NOTHING
+    """,
+    'price_data_weekly': """
+    PREPARE ins_price_data_weekly (varchar, date[], date[], numeric[], numeric[], numeric[], numeric[], bigint[]) AS
+    INSERT INTO dhanhq.price_data_weekly (security_id, week_start_date, week_end_date, open, high, low, close, volume)
+    SELECT $1, t.* FROM unnest($2, $3, $4, $5, $6, $7, $8) AS t
+    ON CONFLICT (security_id, week_start_date) DO NOTHING
+    """,
+    'price_data_monthly': """
+    PREPARE ins_price_data_monthly (varchar, int[], int[], date[], date[], numeric[], numeric[], numeric[], numeric[], bigint[]) AS
+    INSERT INTO dhanhq.price_data_monthly (security_id, year, month, first_date, last_date, open, high, low, close, volume)
+    SELECT $1, t.* FROM unnest($2, $3, $4, $5, $6, $7, $8, $9, $10) AS t
+    ON CONFLICT (security_id, year, month) DO NOTHING
+    """,
+    'price_data': """
+    PREPARE ins_price_data (varchar, int[], timestamptz[], numeric[], numeric[], numeric[], numeric[], bigint[]) AS
+    INSERT INTO dhanhq.price_data (security_id, interval_minutes, datetime, open, high, low, close, volume)
+    SELECT $1, t.* FROM unnest($2, $3, $4, $5, $6, $7, $8) AS t
+    ON CONFLICT (security_id, interval_minutes, datetime) DO NOTHING
+    """
+}
+
+# Intervals updated concurrently
+MAX_WORKERS = 3
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the rate of API requests"""
+    
+    def __init__(self, rate, capacity):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Take one token, sleeping only as long as needed for one to refill"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            
+            wait = 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        
+        if wait > 0:
+            time.sleep(wait)
+
+def trading_days(datetimes):
+    """Trading date of each candle as datetime64[D], without per-row branching
+    
+    Daily candles are stamped 18:30 of the previous day, so anything at or after
+    18:00 belongs to the next day.
+    """
+    values = datetimes.to_numpy()
+    days = values.astype('datetime64[D]')
+    hours = (values - days) // np.timedelta64(1, 'h')
+    return days + (hours >= 18).astype('timedelta64[D]')
+
 class DailyDataUpdaterV2:
     def __init__(self, progress_callback=None):
         """Initialize the daily data updater
@@ -45,6 +135,44 @@ class DailyDataUpdaterV2:
         # Security ID for MANKIND
         self.security_id = '15380'
         
+        # Persistent HTTP session so batches reuse pooled keep-alive connections
+        self.session = self.create_http_session()
+        
+        # High-water mark per interval: queried from the database on first use
+        # in a run, then advanced in-process by our own inserts
+        self.last_timestamps = {}
+        
+        # During run_daily_update each worker thread holds one connection
+        # checked out of this pool for all of its queries and inserts
+        self.pool = None
+        self.local = threading.local()
+        
+        # Caps the DhanHQ request rate across worker threads
+        # (429s are still retried with backoff by the session adapter)
+        self.rate_limiter = TokenBucket(rate=5.0, capacity=5)
+        
+        # Tables whose PREPARED_INSERTS entry each connection has defined
+        self.prepared_tables = weakref.WeakKeyDictionary()
+        
+    def create_http_session(self):
+        """Create pooled HTTP session with retry/backoff and default API headers"""
+        session = requests.Session()
+        
+        # Chart endpoints are read-only, so POSTs are safe to retry
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=['POST']
+        )
+        session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+        session.headers.update({
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'access-token': self.api_token or ''
+        })
+        return session
+    
     def log_progress(self, message, level='info'):
         """Log progress and call callback if provided"""
         if level == 'info':
@@ -62,11 +190,26 @@ class DailyDataUpdaterV2:
             })
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_params)
+        """Get this thread's pooled run connection, or create a new one outside a run"""
+        if self.pool is None:
+            return psycopg2.connect(**self.db_params)
+        
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.pool.getconn()
+            self.local.conn = conn
+        return conn
+    
+    def release_db_connection(self, conn):
+        """Close a connection unless it is held from the run pool"""
+        if self.pool is None:
+            conn.close()
     
     def get_last_timestamp(self, interval_minutes):
         """Get the last timestamp in database for given interval"""
+        if interval_minutes in self.last_timestamps:
+            return self.last_timestamps[interval_minutes]
+        
         conn = self.get_db_connection()
         cur = conn.cursor()
         
@@ -112,11 +255,81 @@ class DailyDataUpdaterV2:
             result = cur.fetchone()
             last_timestamp = result[0] if result and result[0] else None
             
+            # End the read-only transaction so the shared connection is not
+            # left idle in transaction during the API fetch
+            conn.commit()
+            
+            self.last_timestamps[interval_minutes] = last_timestamp
             return last_timestamp
             
         finally:
             cur.close()
-            conn.close()
+            self.release_db_connection(conn)
+    
+    def advance_last_timestamp(self, interval_minutes, timestamp):
+        """Advance the in-process high-water mark after our own insert
+        
+        Skips the MAX() query for later reads in the same run. Only intraday
+        intervals are tracked since their stored column is the candle datetime.
+        """
+        current = self.last_timestamps.get(interval_minutes)
+        if current is not None and getattr(current, 'tzinfo', None) is not None:
+            current = current.replace(tzinfo=None)
+        if current is None or timestamp > current:
+            self.last_timestamps[interval_minutes] = timestamp
+    
+    def _post_and_build_df(self, url, payload, label):
+        """POST a chart request and build a typed candle DataFrame from the response
+        
+        Single place for rate limiting, session reuse, response decoding and
+        DataFrame construction shared by the intraday and historical fetchers.
+        
+        Args:
+            url: DhanHQ v2 chart endpoint
+            payload: Request body
+            label: Interval description used in log messages (e.g. '5-minute', 'daily')
+        """
+        try:
+            self.log_progress(f"Fetching {label} data from {payload['fromDate']} to {payload['toDate']}", 'info')
+            self.rate_limiter.acquire()
+            response = self.session.post(url, json=payload, timeout=(5, 30))
+            
+            # Log response details if error
+            if response.status_code != 200:
+                self.log_progress(f"API Error Response: Status={response.status_code}, Body={response.text}", 'error')
+                response.raise_for_status()
+            
+            data = orjson.loads(response.content) if orjson else response.json()
+            
+            # The v2 API returns data directly, not nested
+            if not (isinstance(data, dict) and 'timestamp' in data):
+                self.log_progress(f"Unexpected response format for {label} data", 'warning')
+                self.log_progress(f"Response keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}", 'info')
+                return pd.DataFrame()
+            
+            # Data comes as dict with arrays for each field
+            timestamps = data.get('timestamp', [])
+            if not timestamps:
+                self.log_progress(f"No data returned for {label} data", 'warning')
+                return pd.DataFrame()
+            
+            # Create DataFrame from typed arrays, converting epoch seconds
+            # straight to datetime64 without a temporary timestamp column
+            df = pd.DataFrame({
+                'datetime': np.asarray(timestamps, dtype='int64').view('datetime64[s]').astype('datetime64[ns]'),
+                'open': np.asarray(data.get('open', []), dtype='float64'),
+                'high': np.asarray(data.get('high', []), dtype='float64'),
+                'low': np.asarray(data.get('low', []), dtype='float64'),
+                'close': np.asarray(data.get('close', []), dtype='float64'),
+                'volume': np.asarray(data.get('volume', []), dtype='int64')
+            })
+            
+            self.log_progress(f"Received {len(df)} {label} candles", 'info')
+            return df
+                
+        except Exception as e:
+            self.log_progress(f"Error fetching {label} data: {e}", 'error')
+            return pd.DataFrame()
     
     def fetch_intraday_data(self, interval, from_date, to_date):
         """Fetch intraday data from DhanHQ API v2
@@ -130,12 +343,6 @@ class DailyDataUpdaterV2:
             
         url = "https://api.dhan.co/v2/charts/intraday"
         
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'access-token': self.api_token
-        }
-        
         # Convert interval to string format as per API docs
         interval_str = str(interval)
         
@@ -148,55 +355,7 @@ class DailyDataUpdaterV2:
             'toDate': to_date.strftime('%Y-%m-%d')  # Non-inclusive end date
         }
         
-        try:
-            self.log_progress(f"Fetching {interval}-minute data from {from_date.strftime('%Y-%m-%d')} to {to_date.strftime('%Y-%m-%d')}", 'info')
-            response = requests.post(url, headers=headers, json=payload)
-            
-            # Log response details if error
-            if response.status_code != 200:
-                self.log_progress(f"API Error Response: Status={response.status_code}, Body={response.text}", 'error')
-                response.raise_for_status()
-            
-            data = response.json()
-            
-            # The v2 API returns data directly, not nested
-            if isinstance(data, dict) and 'timestamp' in data:
-                # Data comes as dict with arrays for each field
-                timestamps = data.get('timestamp', [])
-                opens = data.get('open', [])
-                highs = data.get('high', [])
-                lows = data.get('low', [])
-                closes = data.get('close', [])
-                volumes = data.get('volume', [])
-                
-                if timestamps:
-                    # Create DataFrame from arrays
-                    df = pd.DataFrame({
-                        'timestamp': timestamps,
-                        'open': opens,
-                        'high': highs,
-                        'low': lows,
-                        'close': closes,
-                        'volume': volumes
-                    })
-                    
-                    # Convert timestamp to datetime (epoch seconds to datetime)
-                    df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
-                    df = df.drop('timestamp', axis=1)
-                    
-                    self.log_progress(f"Received {len(df)} candles for interval {interval}", 'info')
-                    return df
-                else:
-                    self.log_progress(f"No data returned for interval {interval}", 'warning')
-                    return pd.DataFrame()
-            else:
-                self.log_progress(f"Unexpected response format for interval {interval}", 'warning')
-                self.log_progress(f"Response keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}", 'info')
-                return pd.DataFrame()
-                
-        except Exception as e:
-            self.log_progress(f"Error fetching intraday data: {e}", 'error')
-            return pd.DataFrame()
+        return self._post_and_build_df(url, payload, f"{interval}-minute")
     
     def fetch_historical_data(self, interval, from_date, to_date):
         """Fetch historical (daily/weekly/monthly) data from DhanHQ API v2"""
@@ -209,12 +368,6 @@ class DailyDataUpdaterV2:
             'monthly': 'M'
         }
         
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'access-token': self.api_token
-        }
-        
         payload = {
             'securityId': self.security_id,
             'exchangeSegment': 'NSE_EQ',
@@ -225,54 +378,7 @@ class DailyDataUpdaterV2:
             'interval': interval_map[interval]
         }
         
-        try:
-            self.log_progress(f"Fetching {interval} data from {from_date.strftime('%Y-%m-%d')} to {to_date.strftime('%Y-%m-%d')}", 'info')
-            response = requests.post(url, headers=headers, json=payload)
-            
-            if response.status_code != 200:
-                self.log_progress(f"API Error Response: Status={response.status_code}, Body={response.text}", 'error')
-                response.raise_for_status()
-            
-            data = response.json()
-            
-            # The v2 API returns data directly, not nested
-            if isinstance(data, dict) and 'timestamp' in data:
-                # Data comes as dict with arrays for each field
-                timestamps = data.get('timestamp', [])
-                opens = data.get('open', [])
-                highs = data.get('high', [])
-                lows = data.get('low', [])
-                closes = data.get('close', [])
-                volumes = data.get('volume', [])
-                
-                if timestamps:
-                    # Create DataFrame from arrays
-                    df = pd.DataFrame({
-                        'timestamp': timestamps,
-                        'open': opens,
-                        'high': highs,
-                        'low': lows,
-                        'close': closes,
-                        'volume': volumes
-                    })
-                    
-                    # Convert timestamp to datetime
-                    df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
-                    df = df.drop('timestamp', axis=1)
-                    
-                    self.log_progress(f"Received {len(df)} {interval} candles", 'info')
-                    return df
-                else:
-                    self.log_progress(f"No data returned for interval {interval}", 'warning')
-                    return pd.DataFrame()
-            else:
-                self.log_progress(f"Unexpected response format for interval {interval}", 'warning')
-                self.log_progress(f"Response keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}", 'info')
-                return pd.DataFrame()
-                
-        except Exception as e:
-            self.log_progress(f"Error fetching historical data: {e}", 'error')
-            return pd.DataFrame()
+        return self._post_and_build_df(url, payload, interval)
     
     def save_to_database(self, df, interval_minutes):
         """Save data to database maintaining existing schema"""
@@ -284,135 +390,79 @@ class DailyDataUpdaterV2:
         saved_count = 0
         
         try:
+            # Columns shared by every table, converted once to Python scalars
+            dt = df['datetime']
+            security_ids = itertools.repeat(self.security_id)
+            prices = [df[col].to_numpy(dtype='float64').tolist() for col in ('open', 'high', 'low', 'close')]
+            volumes = df['volume'].to_numpy(dtype='int64').tolist()
+            
             # Determine table and query based on interval
             if interval_minutes == 'daily':
                 table = 'price_data_daily'
-                insert_query = f"""
-                    INSERT INTO dhanhq.{table} 
-                    (security_id, date, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, date) DO NOTHING
-                """
+                columns = 'security_id, date, open, high, low, close, volume'
+                conflict = 'security_id, date'
                 
-                # Insert data
-                for _, row in df.iterrows():
-                    # For daily data, adjust the date if it's showing previous day at 18:30
-                    trade_date = row['datetime']
-                    if trade_date.hour >= 18:  # If time is 18:30 or later, it's actually next day's data
-                        trade_date = trade_date + timedelta(days=1)
-                    
-                    values = (
-                        self.security_id,
-                        trade_date.date(),  # Convert to date for daily table
-                        float(row['open']),
-                        float(row['high']),
-                        float(row['low']),
-                        float(row['close']),
-                        int(row['volume'])
-                    )
-                    cur.execute(insert_query, values)
-                    if cur.rowcount > 0:
-                        saved_count += 1
+                # For daily data, adjust the date if it's showing previous day at 18:30
+                # (18:30 or later is actually next day's data)
+                trade_dates = trading_days(dt).astype(object)
+                
+                rows = list(zip(security_ids, trade_dates, *prices, volumes))
                         
             elif interval_minutes == 'weekly':
                 table = 'price_data_weekly'
                 # Weekly table has week_start_date and week_end_date
-                insert_query = f"""
-                    INSERT INTO dhanhq.{table} 
-                    (security_id, week_start_date, week_end_date, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, week_start_date) DO NOTHING
-                """
+                columns = 'security_id, week_start_date, week_end_date, open, high, low, close, volume'
+                conflict = 'security_id, week_start_date'
                 
-                # Insert data
-                for _, row in df.iterrows():
-                    # Calculate week start (Monday) and end (Friday) dates
-                    week_end = row['datetime'].date()
-                    week_start = week_end - timedelta(days=week_end.weekday())
-                    
-                    values = (
-                        self.security_id,
-                        week_start,
-                        week_end,
-                        float(row['open']),
-                        float(row['high']),
-                        float(row['low']),
-                        float(row['close']),
-                        int(row['volume'])
-                    )
-                    cur.execute(insert_query, values)
-                    if cur.rowcount > 0:
-                        saved_count += 1
+                # Calculate week start (Monday) and end (Friday) dates
+                week_end = dt.dt.date
+                week_start = (dt.dt.normalize() - pd.to_timedelta(dt.dt.weekday, unit='D')).dt.date
+                
+                rows = list(zip(security_ids, week_start, week_end, *prices, volumes))
                         
             elif interval_minutes == 'monthly':
                 table = 'price_data_monthly'
                 # Monthly table uses year and month columns (integers)
-                insert_query = f"""
-                    INSERT INTO dhanhq.{table} 
-                    (security_id, year, month, first_date, last_date, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, year, month) DO NOTHING
-                """
+                columns = 'security_id, year, month, first_date, last_date, open, high, low, close, volume'
+                conflict = 'security_id, year, month'
                 
-                # Insert data
-                for _, row in df.iterrows():
-                    # Extract year and month from datetime
-                    trade_date = row['datetime']
-                    if trade_date.hour >= 18:  # Adjust date if needed
-                        trade_date = trade_date + timedelta(days=1)
-                    
-                    year = trade_date.year
-                    month = trade_date.month
-                    
-                    # Calculate first and last dates of the month
-                    first_date = trade_date.date().replace(day=1)
-                    if month == 12:
-                        last_date = date(year, 12, 31)
-                    else:
-                        last_date = date(year, month + 1, 1) - timedelta(days=1)
-                    
-                    values = (
-                        self.security_id,
-                        year,
-                        month,
-                        first_date,
-                        last_date,
-                        float(row['open']),
-                        float(row['high']),
-                        float(row['low']),
-                        float(row['close']),
-                        int(row['volume'])
-                    )
-                    cur.execute(insert_query, values)
-                    if cur.rowcount > 0:
-                        saved_count += 1
+                # Adjust date if needed, then extract year and month
+                periods = pd.PeriodIndex(trading_days(dt), freq='M')
+                years = periods.year.tolist()
+                months = periods.month.tolist()
+                
+                # Calculate first and last dates of the month
+                first_dates = periods.start_time.date
+                last_dates = periods.end_time.date
+                
+                rows = list(zip(security_ids, years, months, first_dates, last_dates, *prices, volumes))
                         
             else:
                 # Intraday data
-                insert_query = """
-                    INSERT INTO dhanhq.price_data 
-                    (security_id, interval_minutes, datetime, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (security_id, interval_minutes, datetime) DO NOTHING
-                """
+                table = 'price_data'
+                columns = 'security_id, interval_minutes, datetime, open, high, low, close, volume'
+                conflict = 'security_id, interval_minutes, datetime'
                 
-                # Insert data
-                for _, row in df.iterrows():
-                    values = (
-                        self.security_id,
-                        interval_minutes,
-                        row['datetime'],
-                        float(row['open']),
-                        float(row['high']),
-                        float(row['low']),
-                        float(row['close']),
-                        int(row['volume'])
-                    )
-                    cur.execute(insert_query, values)
-                    if cur.rowcount > 0:
-                        saved_count += 1
+                rows = list(zip(security_ids, itertools.repeat(interval_minutes),
+                                dt.dt.to_pydatetime(), *prices, volumes))
+            
+            if len(rows) > COPY_THRESHOLD:
+                # Large backfill - stream rows through COPY into a staging table
+                saved_count = self.copy_rows(cur, table, columns, conflict, rows)
+            else:
+                # One EXECUTE of the per-connection prepared statement, passing
+                # each column as an array so the whole batch is a single statement
+                self.prepare_insert(conn, table)
+                params = [self.security_id] + [list(col) for col in zip(*rows)][1:]
+                placeholders = ', '.join(['%s'] * len(params))
+                cur.execute(f"EXECUTE ins_{table}({placeholders})", params)
+                saved_count = cur.rowcount
             
             conn.commit()
+            
+            if interval_minutes in (1, 5, 15, 60):
+                self.advance_last_timestamp(interval_minutes, df['datetime'].max().to_pydatetime())
+            
             return saved_count
             
         except Exception as e:
@@ -421,10 +471,47 @@ class DailyDataUpdaterV2:
             raise
         finally:
             cur.close()
-            conn.close()
+            self.release_db_connection(conn)
     
-    def update_intraday_batch(self, interval, from_date, to_date):
-        """Update intraday data in batches of 5 days (API limitation)"""
+    def prepare_insert(self, conn, table):
+        """Define the table's insert prepared statement once per connection"""
+        prepared = self.prepared_tables.setdefault(conn, set())
+        if table in prepared:
+            return
+        
+        with conn.cursor() as cur:
+            cur.execute(PREPARED_INSERTS[table])
+        prepared.add(table)
+    
+    def copy_rows(self, cur, table, columns, conflict, rows):
+        """Bulk load rows via COPY into a temp staging table, then merge with ON CONFLICT
+        
+        Returns the number of rows actually inserted into the target table.
+        """
+        cur.execute(f"""
+            CREATE TEMP TABLE tmp_load ON COMMIT DROP AS
+            SELECT {columns} FROM dhanhq.{table} WITH NO DATA
+        """)
+        
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cur.copy_expert(f"COPY tmp_load ({columns}) FROM STDIN WITH (FORMAT CSV)", buffer)
+        
+        cur.execute(f"""
+            INSERT INTO dhanhq.{table} ({columns})
+            SELECT {columns} FROM tmp_load
+            ON CONFLICT ({conflict}) DO NOTHING
+        """)
+        return cur.rowcount
+    
+    def update_intraday_batch(self, interval, from_date, to_date, last_timestamp=None):
+        """Update intraday data in batches of 5 days (API limitation)
+        
+        Args:
+            last_timestamp: Last stored candle already known by the caller (naive);
+                advanced from each saved batch instead of being re-queried
+        """
         current_date = from_date
         total_saved = 0
         
@@ -437,22 +524,19 @@ class DailyDataUpdaterV2:
             # Fetch data for this batch
             df = self.fetch_intraday_data(interval, current_date, batch_end)
             
-            if not df.empty:
-                # Filter to only new data
-                last_timestamp = self.get_last_timestamp(interval)
-                if last_timestamp:
-                    if hasattr(last_timestamp, 'tzinfo') and last_timestamp.tzinfo is not None:
-                        last_timestamp = last_timestamp.replace(tzinfo=None)
-                    df = df[df['datetime'] > last_timestamp]
-                
-                if not df.empty:
-                    saved = self.save_to_database(df, interval)
-                    total_saved += saved
-                    self.log_progress(f"Saved {saved} records for batch {current_date.date()} to {batch_end.date()}")
+            # The API returns whole days sorted by time, so a batch whose last candle
+            # is not newer than what is stored needs no database round trip
+            if not df.empty and last_timestamp and df['datetime'].iloc[-1] <= last_timestamp:
+                self.log_progress(f"No new records for batch {current_date.date()} to {batch_end.date()}")
+            elif not df.empty:
+                # Rows already stored are skipped server-side by ON CONFLICT DO NOTHING
+                saved = self.save_to_database(df, interval)
+                total_saved += saved
+                last_timestamp = df['datetime'].iloc[-1]
+                self.log_progress(f"Saved {saved} records for batch {current_date.date()} to {batch_end.date()}")
             
-            # Move to next batch
+            # Move to next batch (request rate is limited in the fetcher)
             current_date = batch_end
-            time.sleep(0.5)  # Rate limiting
         
         return total_saved
     
@@ -529,7 +613,7 @@ class DailyDataUpdaterV2:
         # Fetch and save data
         if interval in [1, 5, 15, 60]:
             # Intraday data - use batch processing
-            saved_count = self.update_intraday_batch(interval, from_date, to_date)
+            saved_count = self.update_intraday_batch(interval, from_date, to_date, last_timestamp)
         else:
             # Historical data - single request
             self.log_progress(f"Fetching {interval_name} data from {from_date.date()} to {to_date.date()}")
@@ -539,23 +623,23 @@ class DailyDataUpdaterV2:
                 self.log_progress(f"No new {interval_name} data available")
                 return 0
             
-            # Filter to only new data
-            if last_timestamp:
-                # Convert last_timestamp to datetime if it's a date object
-                if isinstance(last_timestamp, date) and not isinstance(last_timestamp, datetime):
-                    last_timestamp = datetime.combine(last_timestamp, datetime.min.time())
-                df = df[df['datetime'] > last_timestamp]
-            
-            if df.empty:
-                self.log_progress(f"No new {interval_name} data after filtering")
-                return 0
-            
-            # Save to database
+            # Save to database - rows already stored are skipped server-side
+            # by ON CONFLICT DO NOTHING, so no client-side filtering is needed
             saved_count = self.save_to_database(df, interval)
         
         self.log_progress(f"Saved {saved_count} new {interval_name} records")
         return saved_count
     
+    def update_interval_worker(self, interval):
+        """Update a single interval on a worker thread, returning its pooled connection"""
+        try:
+            return self.update_single_interval(interval)
+        finally:
+            conn = getattr(self.local, 'conn', None)
+            if conn is not None:
+                self.local.conn = None
+                self.pool.putconn(conn)
+    
     def run_daily_update(self):
         """Run the complete daily update process"""
         self.log_progress("="*60)
@@ -565,14 +649,19 @@ class DailyDataUpdaterV2:
         start_time = datetime.now()
         total_saved = 0
         
+        # Start every run from the database's view of the last timestamps
+        self.last_timestamps = {}
+        
         try:
-            # Update each interval
+            # One connection per worker thread for every query and insert of this run
+            self.pool = ThreadedConnectionPool(1, MAX_WORKERS, **self.db_params)
+            
+            # Update intervals concurrently - each is independent and bound by API I/O
             intervals = [1, 5, 15, 60, 'daily', 'weekly', 'monthly']
             
-            for interval in intervals:
-                saved = self.update_single_interval(interval)
-                total_saved += saved
-                time.sleep(0.5)  # Rate limiting
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                for saved in executor.map(self.update_interval_worker, intervals):
+                    total_saved += saved
             
             elapsed = datetime.now() - start_time
             
@@ -594,6 +683,10 @@ class DailyDataUpdaterV2:
                 'status': 'error',
                 'error': str(e)
             }
+        finally:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
 
 if __name__ == "__main__":
     # Test the updater
@@ -1,14 +1,111 @@
+import atexit
+import io
+import itertools
 import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 import pandas as pd
 from sqlalchemy import create_engine, text
 from sqlalchemy.pool import QueuePool
+import numpy as np
 import psycopg2
 from psycopg2.extras import execute_values
 
+# Optional: sqlparse lets create_schema stream the script statement by statement
+try:
+    import sqlparse
+except ImportError:
+    sqlparse = None
+
 logger = logging.getLogger(__name__)
 
+# Frames larger than this are loaded with COPY through a staging table
+COPY_THRESHOLD = 1024
+
+# Seconds a cached read-only lookup stays valid
+CACHE_TTL = {
+    'latest_data_date': 60,
+    'security_by_symbol': 3600,
+    'data_summary': 30,
+}
+
+# Server-side prepared statements for the per-call metadata writes
+PREPARED_STATEMENTS = [
+    """
+    PREPARE upsert_security(varchar, varchar, varchar, varchar, varchar, varchar) AS
+    INSERT INTO dhanhq.securities (security_id, symbol, name, exchange, instrument_type, isin)
+    VALUES ($1, $2, $3, $4, $5, $6)
+    ON CONFLICT (security_id) 
+    DO UPDATE SET 
+        symbol = EXCLUDED.symbol,
+        name = EXCLUDED.name,
+        updated_at = CURRENT_TIMESTAMP
+    """,
+]
+
+# Buffered download_history rows are flushed at this many rows or seconds
+LOG_FLUSH_ROWS = 500
+LOG_FLUSH_SECONDS = 5.0
+
+LOG_INSERT_SQL = """
+    INSERT INTO dhanhq.download_history 
+    (security_id, from_date, to_date, interval_minutes, records_downloaded, status, error_message)
+    VALUES %s
+"""
+
+PRICE_COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+
+# PostgreSQL binary COPY framing; timestamps count microseconds from 2000-01-01
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + b'\x00' * 8
+PGCOPY_TRAILER = b'\xff\xff'
+PG_EPOCH_US = 946684800 * 10**6
+
+
+def binary_copy_buffer(security_id: str, interval: int, dt: pd.DatetimeIndex,
+                       o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray,
+                       v: np.ndarray) -> Tuple[io.BytesIO, str]:
+    """Encode price columns in COPY BINARY format for the stg_price layout
+    
+    Rows are packed with one big-endian structured array, so no per-row
+    Python work happens. OHLC go out as float8 and are cast to numeric by
+    the merge. Returns the buffer and the staging datetime column type.
+    """
+    if dt.tz is not None:
+        dt = dt.tz_convert('UTC').tz_localize(None)
+        dt_type = 'TIMESTAMPTZ'
+    else:
+        # Naive values keep CSV semantics: interpreted in the session time zone
+        dt_type = 'TIMESTAMP'
+    
+    sid = security_id.encode('utf-8')
+    fields = [('count', '>i2'), ('sid_len', '>i4'), ('sid', f'S{len(sid)}')]
+    for name, fmt in (('ts', '>i8'), ('open', '>f8'), ('high', '>f8'), ('low', '>f8'),
+                      ('close', '>f8'), ('volume', '>i8'), ('interval', '>i4')):
+        fields += [(f'{name}_len', '>i4'), (name, fmt)]
+    rows = np.empty(len(dt), dtype=np.dtype(fields))
+    
+    rows['count'] = 8
+    rows['sid_len'] = len(sid)
+    rows['sid'] = sid
+    rows['ts'] = dt.values.astype('datetime64[us]').astype(np.int64) - PG_EPOCH_US
+    rows['open'], rows['high'], rows['low'], rows['close'] = o, h, l, c
+    rows['volume'] = v
+    rows['interval'] = interval
+    for name, size in (('ts', 8), ('open', 8), ('high', 8), ('low', 8),
+                       ('close', 8), ('volume', 8), ('interval', 4)):
+        rows[f'{name}_len'] = size
+    
+    buf = io.BytesIO()
+    buf.write(PGCOPY_HEADER)
+    buf.write(rows.tobytes())
+    buf.write(PGCOPY_TRAILER)
+    buf.seek(0)
+    return buf, dt_type
+
 class DatabaseManager:
     """Handles all database operations"""
     
@@ -17,10 +114,58 @@ class DatabaseManager:
         self.engine = create_engine(
             config.db_url,
             poolclass=QueuePool,
-            pool_size=5,
-            max_overflow=10,
-            pool_pre_ping=True
+            pool_size=10,
+            max_overflow=20,
+            pool_recycle=1800,
+            pool_use_lifo=True,
+            pool_pre_ping=True,
+            query_cache_size=1200,
+            connect_args={"options": "-c statement_timeout=30000"}
         )
+        # (method, args) -> (value, expiry) for read-only lookups
+        self.query_cache = {}
+        # DBAPI connections that already hold PREPARED_STATEMENTS
+        self.prepared_conns = weakref.WeakSet()
+        # Write-behind buffer for download_history rows
+        self.log_buffer = []
+        self.log_lock = threading.Lock()
+        self.log_flushed_at = time.monotonic()
+        # The time-based flush only runs on the next log_download, so write
+        # whatever is still buffered when the process ends without close()
+        atexit.register(self.flush_logs)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def close(self) -> None:
+        """Flush pending log rows and release pooled connections"""
+        atexit.unregister(self.flush_logs)
+        self.flush_logs()
+        self.engine.dispose()
+    
+    def cached(self, key, loader):
+        """Return a cached lookup result, reloading it once its TTL expires
+        
+        Misses (None) are not cached, so a row inserted later is seen at once.
+        """
+        now = time.monotonic()
+        hit = self.query_cache.get(key)
+        if hit is not None and hit[1] > now:
+            return hit[0]
+        value = loader()
+        if value is not None:
+            self.query_cache[key] = (value, now + CACHE_TTL[key[0]])
+        return value
+    
+    def invalidate(self, security_id: str) -> None:
+        """Drop cached lookups that depend on a security's price data"""
+        # Snapshot keys first; parallel inserts may invalidate concurrently
+        for key in list(self.query_cache):
+            if key[0] != 'security_by_symbol' and key[1] == security_id:
+                self.query_cache.pop(key, None)
     
     def test_connection(self) -> bool:
         """Test database connection"""
@@ -36,50 +181,172 @@ class DatabaseManager:
         """Create database schema"""
         try:
             with open('sql/schema.sql', 'r') as f:
-                schema_sql = f.read()
-            
-            with self.engine.connect() as conn:
-                conn.execute(text(schema_sql))
-                conn.commit()
+                if sqlparse is None:
+                    with self.engine.connect() as conn:
+                        conn.execute(text(f.read()))
+                        conn.commit()
+                else:
+                    # Execute one statement at a time so errors name the statement
+                    with self.engine.begin() as conn:
+                        for statement in sqlparse.parsestream(f):
+                            sql = str(statement).strip()
+                            if not sql or sql == ';':
+                                continue
+                            try:
+                                conn.exec_driver_sql(sql)
+                            except Exception:
+                                logger.error(f"Schema statement failed: {sql[:200]}")
+                                raise
             logger.info("Database schema created successfully")
         except Exception as e:
             logger.error(f"Error creating schema: {e}")
             raise
     
-    def upsert_security(self, security_data: Dict) -> None:
-        """Insert or update security information"""
-        sql = """
-            INSERT INTO dhanhq.securities (security_id, symbol, name, exchange, instrument_type, isin)
-            VALUES (:security_id, :symbol, :name, :exchange, :instrument_type, :isin)
-            ON CONFLICT (security_id) 
-            DO UPDATE SET 
-                symbol = EXCLUDED.symbol,
-                name = EXCLUDED.name,
-                updated_at = CURRENT_TIMESTAMP
-        """
+    def prepare_statements(self, conn):
+        """Define the prepared statements once per pooled connection"""
+        raw = conn.dbapi_connection
+        if raw in self.prepared_conns:
+            return
         
-        with self.engine.connect() as conn:
-            conn.execute(text(sql), security_data)
+        with raw.cursor() as cursor:
+            for statement in PREPARED_STATEMENTS:
+                cursor.execute(statement)
+        self.prepared_conns.add(raw)
+    
+    def execute_prepared(self, name: str, params: Tuple) -> None:
+        """Run a prepared statement on a pooled connection and commit"""
+        conn = self.engine.raw_connection()
+        try:
+            self.prepare_statements(conn)
+            with conn.cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(params))
+                cursor.execute(f"EXECUTE {name}({placeholders})", params)
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def upsert_security(self, security_data: Dict) -> None:
+        """Insert or update security information"""
+        self.execute_prepared('upsert_security', (
+            security_data['security_id'],
+            security_data['symbol'],
+            security_data['name'],
+            security_data['exchange'],
+            security_data['instrument_type'],
+            security_data['isin']
+        ))
+        # The upsert may add this symbol or rename the security away from an old one
+        for key, (value, _) in list(self.query_cache.items()):
+            if key[0] == 'security_by_symbol' and (
+                    key[1] == security_data['symbol'] or
+                    value['security_id'] == security_data['security_id']):
+                self.query_cache.pop(key, None)
     
     def insert_price_data(self, df: pd.DataFrame, security_id: str, interval: int) -> int:
         """Bulk insert price data using psycopg2 for better performance"""
         if df.empty:
             return 0
+        return self.insert_price_data_arrays(
+            security_id, interval, df['datetime'],
+            *(df[k].to_numpy() for k in ('open', 'high', 'low', 'close', 'volume'))
+        )
+    
+    def insert_price_data_arrays(self, security_id: str, interval: int, dt, o, h, l, c, v) -> int:
+        """Bulk insert price data from column arrays, without building a DataFrame
         
-        # Prepare data for insertion
-        data = []
-        for _, row in df.iterrows():
-            data.append((
-                security_id,
-                row['datetime'],
-                float(row['open']),
-                float(row['high']),
-                float(row['low']),
-                float(row['close']),
-                int(row['volume']),
-                interval
-            ))
+        Args:
+            dt: Bar timestamps (datetime64 array, DatetimeIndex or datetimes)
+            o, h, l, c: Open/high/low/close prices
+            v: Volumes
+        """
+        if len(dt) == 0:
+            return 0
+        
+        dt = pd.DatetimeIndex(dt)
+        o, h, l, c = (np.asarray(x, dtype=np.float64) for x in (o, h, l, c))
+        v = np.asarray(v, dtype=np.int64)
+        
+        # Borrow a DBAPI connection from the engine's pool; close() returns it
+        conn = self.engine.raw_connection()
+        
+        try:
+            with conn.cursor() as cursor:
+                # Bulk loads are replayable, so skip waiting on WAL flush
+                cursor.execute("SET LOCAL synchronous_commit = off")
+                if len(dt) > COPY_THRESHOLD:
+                    count = self.copy_price_data(cursor, security_id, interval, dt, o, h, l, c, v)
+                else:
+                    count = self.execute_values_price_data(cursor, security_id, interval, dt, o, h, l, c, v)
+                conn.commit()
+                self.invalidate(security_id)
+                return count
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error inserting price data: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    def insert_price_data_many(self, items: List[Tuple[pd.DataFrame, str, int]],
+                               max_workers: int = 8) -> int:
+        """Insert several (df, security_id, interval) frames concurrently
+        
+        Each worker runs insert_price_data on its own pooled connection, so
+        every frame gets its own session-local staging table and transaction.
+        """
+        if not items:
+            return 0
+        workers = min(max_workers, len(items), self.engine.pool.size())
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(lambda item: self.insert_price_data(*item), items))
+    
+    def copy_price_data(self, cursor, security_id: str, interval: int, dt, o, h, l, c, v) -> int:
+        """Stream a large batch through binary COPY into a staging table, then upsert"""
+        buf, dt_type = binary_copy_buffer(security_id, interval, dt, o, h, l, c, v)
+        
+        cursor.execute(f"""
+            CREATE TEMP TABLE stg_price (
+                security_id VARCHAR(50),
+                datetime {dt_type},
+                open DOUBLE PRECISION,
+                high DOUBLE PRECISION,
+                low DOUBLE PRECISION,
+                close DOUBLE PRECISION,
+                volume BIGINT,
+                interval_minutes INT
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert(
+            "COPY stg_price (security_id, datetime, open, high, low, close, volume, interval_minutes) "
+            "FROM STDIN WITH (FORMAT BINARY)",
+            buf
+        )
+        cursor.execute("""
+            INSERT INTO dhanhq.price_data 
+            (security_id, datetime, open, high, low, close, volume, interval_minutes)
+            SELECT security_id, datetime, open, high, low, close, volume, interval_minutes
+            FROM stg_price
+            ON CONFLICT (security_id, datetime, interval_minutes) 
+            DO UPDATE SET
+                open = EXCLUDED.open,
+                high = EXCLUDED.high,
+                low = EXCLUDED.low,
+                close = EXCLUDED.close,
+                volume = EXCLUDED.volume
+        """)
+        return len(dt)
+    
+    def execute_values_price_data(self, cursor, security_id: str, interval: int, dt, o, h, l, c, v) -> int:
+        """Insert a small batch with execute_values"""
+        # Prepare data for insertion; casts already happened column-wise in NumPy
+        data = list(zip(
+            itertools.repeat(security_id), dt.tolist(),
+            o.tolist(), h.tolist(), l.tolist(), c.tolist(), v.tolist(),
+            itertools.repeat(interval)
+        ))
         
         insert_sql = """
             INSERT INTO dhanhq.price_data 
@@ -94,38 +361,19 @@ class DatabaseManager:
                 volume = EXCLUDED.volume
         """
         
-        conn = psycopg2.connect(
-            host=self.config.db_host,
-            port=self.config.db_port,
-            database=self.config.db_name,
-            user=self.config.db_user,
-            password=self.config.db_password
-        )
-        
-        try:
-            with conn.cursor() as cursor:
-                # Process in batches
-                batch_size = self.config.batch_size
-                for i in range(0, len(data), batch_size):
-                    batch = data[i:i + batch_size]
-                    execute_values(
-                        cursor,
-                        insert_sql,
-                        batch,
-                        template="(%s, %s, %s, %s, %s, %s, %s, %s)",
-                        page_size=1000
-                    )
-                conn.commit()
-                return len(data)
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error inserting price data: {e}")
-            raise
-        finally:
-            conn.close()
+        # execute_values pages internally; one call keeps VALUES groups large
+        execute_values(cursor, insert_sql, data, page_size=10000)
+        return len(data)
     
     def get_latest_data_date(self, security_id: str, interval: int) -> Optional[datetime]:
         """Get the latest date for which we have data"""
+        return self.cached(
+            ('latest_data_date', security_id, interval),
+            lambda: self.load_latest_data_date(security_id, interval)
+        )
+    
+    def load_latest_data_date(self, security_id: str, interval: int) -> Optional[datetime]:
+        """Query the latest date for which we have data"""
         sql = """
             SELECT MAX(datetime) 
             FROM dhanhq.price_data 
@@ -143,27 +391,46 @@ class DatabaseManager:
     
     def log_download(self, security_id: str, from_date: datetime, to_date: datetime, 
                     interval: int, records: int, status: str, error: str = None):
-        """Log download history"""
-        sql = """
-            INSERT INTO dhanhq.download_history 
-            (security_id, from_date, to_date, interval_minutes, records_downloaded, status, error_message)
-            VALUES (:security_id, :from_date, :to_date, :interval, :records, :status, :error)
-        """
+        """Log download history; rows are buffered and written in batches"""
+        with self.log_lock:
+            self.log_buffer.append((
+                security_id, from_date, to_date, interval, records, status, error
+            ))
+            due = (len(self.log_buffer) >= LOG_FLUSH_ROWS or
+                   time.monotonic() - self.log_flushed_at >= LOG_FLUSH_SECONDS)
+        if due:
+            self.flush_logs()
+    
+    def flush_logs(self) -> int:
+        """Write buffered download_history rows in one round-trip"""
+        with self.log_lock:
+            rows, self.log_buffer = self.log_buffer, []
+            self.log_flushed_at = time.monotonic()
+        if not rows:
+            return 0
         
-        with self.engine.connect() as conn:
-            conn.execute(text(sql), {
-                "security_id": security_id,
-                "from_date": from_date,
-                "to_date": to_date,
-                "interval": interval,
-                "records": records,
-                "status": status,
-                "error": error
-            })
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, LOG_INSERT_SQL, rows, page_size=1000)
             conn.commit()
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error flushing download history: {e}")
+            raise
+        finally:
+            conn.close()
     
     def get_security_by_symbol(self, symbol: str) -> Optional[Dict]:
         """Get security details by symbol"""
+        return self.cached(
+            ('security_by_symbol', symbol),
+            lambda: self.load_security_by_symbol(symbol)
+        )
+    
+    def load_security_by_symbol(self, symbol: str) -> Optional[Dict]:
+        """Query security details by symbol"""
         sql = """
             SELECT security_id, symbol, name, exchange, instrument_type
             FROM dhanhq.securities
@@ -179,13 +446,16 @@ class DatabaseManager:
     
     def get_data_summary(self, security_id: str) -> Optional[Dict]:
         """Get summary statistics for a security"""
+        return self.cached(
+            ('data_summary', security_id),
+            lambda: self.load_data_summary(security_id)
+        )
+    
+    def load_data_summary(self, security_id: str) -> Optional[Dict]:
+        """Look up summary statistics maintained by the price_data trigger"""
         sql = """
-            SELECT 
-                COUNT(*) as total_records,
-                MIN(datetime) as first_date,
-                MAX(datetime) as last_date,
-                COUNT(DISTINCT DATE(datetime)) as trading_days
-            FROM dhanhq.price_data
+            SELECT total_records, first_date, last_date, trading_days
+            FROM dhanhq.security_summary
             WHERE security_id = :security_id
         """
         
@@ -194,4 +464,36 @@ class DatabaseManager:
             row = result.fetchone()
             if row:
                 return dict(row._mapping)
-            return None
\ No newline at end of file
+            return {'total_records': 0, 'first_date': None, 'last_date': None, 'trading_days': 0}
+    
+    def get_ingest_header(self, security_id: str, interval: int) -> Dict:
+        """Get the latest date and summary statistics in a single round-trip"""
+        sql = """
+            SELECT 
+                (SELECT MAX(datetime) FROM dhanhq.price_data
+                 WHERE security_id = :security_id AND interval_minutes = :interval) as latest,
+                COALESCE(s.total_records, 0) as total_records,
+                s.first_date,
+                s.last_date,
+                COALESCE(s.trading_days, 0) as trading_days
+            FROM (SELECT 1) AS one
+            LEFT JOIN dhanhq.security_summary s ON s.security_id = :security_id
+        """
+        
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                text(sql),
+                {"security_id": security_id, "interval": interval}
+            )
+            header = dict(result.fetchone()._mapping)
+        
+        # Seed the individual lookups so later calls skip the database; like
+        # cached(), a missing latest date is not stored
+        expiry = time.monotonic()
+        summary = {k: header[k] for k in ('total_records', 'first_date', 'last_date', 'trading_days')}
+        if header['latest'] is not None:
+            self.query_cache[('latest_data_date', security_id, interval)] = (
+                header['latest'], expiry + CACHE_TTL['latest_data_date'])
+        self.query_cache[('data_summary', security_id)] = (
+            summary, expiry + CACHE_TTL['data_summary'])
+        return header
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Shared PostgreSQL connection pool
+One lazily created pool serves the recommendation generator and the validator
+"""
+
+import atexit
+import threading
+from psycopg2.pool import ThreadedConnectionPool
+
+POOL_MINCONN = 2
+POOL_MAXCONN = 10
+POOL = None
+POOL_LOCK = threading.Lock()
+
+def get_pool(db_params):
+    """Return the process-wide connection pool, creating it on first use"""
+    global POOL
+    if POOL is None:
+        with POOL_LOCK:
+            if POOL is None:
+                POOL = ThreadedConnectionPool(POOL_MINCONN, POOL_MAXCONN, **db_params)
+                atexit.register(POOL.closeall)
+    return POOL
+
+def get_db_connection(db_params):
+    """Borrow a connection from the shared pool"""
+    return get_pool(db_params).getconn()
+
+def release_db_connection(db_params, conn):
+    """Return a borrowed connection; open transactions are rolled back"""
+    get_pool(db_params).putconn(conn)
@@ -5,20 +5,93 @@ Validates trading recommendations using Adam Grimes' perspective
 """
 
 import os
+import re
 import json
-from openai import OpenAI
+import asyncio
+import hashlib
+import threading
+import queue
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, AsyncOpenAI
 from datetime import datetime
 import psycopg2
 from dotenv import load_dotenv
+from src.db_pool import POOL_MAXCONN, get_db_connection, release_db_connection
 import logging
 
 load_dotenv()
 
+# Score patterns like "7/10", "8 out of 10", "score: 7", "rating: 7"
+SCORE_RE = re.compile(
+    r'(?:(\d+)/10|(\d+)\s+out\s+of\s+10|score[:\s]+(\d+)|rating[:\s]+(\d+))',
+    re.IGNORECASE
+)
+SCORE_SCAN_CHARS = 1024
+
+GPT_MODEL = os.getenv('GPT_MODEL', 'gpt-4')
+# Models that accept response_format={"type": "json_object"}; others are only
+# asked for JSON in the prompt and fall back to regex scoring if they ignore it
+JSON_MODE_PREFIXES = ('gpt-4o', 'gpt-4-turbo', 'gpt-4.1', 'gpt-3.5-turbo')
+
+# Text sent to GPT; missing fields render as N/A
+REC_TEMPLATE = """
+Trading Recommendation for {symbol}
+Generated: {generated_at}
+
+Current Market Context:
+- Price: ₹{current_price}
+- 1-min Trend: {trend_1min}
+- 5-min Trend: {trend_5min}
+- 15-min Trend: {trend_15min}
+- 60-min Trend: {trend_60min}
+- Daily Trend: {trend_daily}
+
+Support/Resistance Levels:
+- Resistance: R1=₹{resistance_1}, R2=₹{resistance_2}, R3=₹{resistance_3}
+- Support: S1=₹{support_1}, S2=₹{support_2}, S3=₹{support_3}
+
+Intraday Recommendation:
+- Action: {intraday_action}
+- Entry: ₹{intraday_entry}
+- Stop Loss: ₹{intraday_stoploss}
+- Target 1: ₹{intraday_target1}
+- Target 2: ₹{intraday_target2}
+- Risk/Reward: {intraday_risk_reward}
+- Rationale: {intraday_rationale}
+
+Swing Trading Recommendation:
+- Action: {swing_action}
+- Entry: ₹{swing_entry}
+- Stop Loss: ₹{swing_stoploss}
+- Targets: ₹{swing_target1}, ₹{swing_target2}, ₹{swing_target3}
+- Risk/Reward: {swing_risk_reward}
+- Rationale: {swing_rationale}
+
+Full Analysis:
+{recommendation_text}
+"""
+
+# Intraday fields a recommendation needs before it is worth sending to GPT
+REQUIRED_FIELDS = ['intraday_action', 'intraday_entry', 'intraday_stoploss', 'intraday_target1']
+MAX_MISSING_FIELDS = 1
+INSUFFICIENT_DATA_SCORE = 1
+INSUFFICIENT_DATA_TEXT = "Insufficient data: recommendation is missing required trade levels"
+
+# Cache keys cover the fields GPT judges, not when the recommendation was generated
+CACHE_KEY_TEMPLATE = REC_TEMPLATE.replace('Generated: {generated_at}\n', '')
+
+def validation_cache_key(rec):
+    """Hash a recommendation's content fields; collision resistance is not needed"""
+    text = CACHE_KEY_TEMPLATE.format_map(defaultdict(lambda: 'N/A', rec))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
 class AdamGrimesValidator:
     def __init__(self):
         """Initialize the validator with Adam Grimes persona"""
         self.api_key = os.getenv('OPENAI_API_KEY')
         self.client = OpenAI(api_key=self.api_key)
+        self.aclient = AsyncOpenAI(api_key=self.api_key)
         
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
@@ -61,11 +134,18 @@ Focus on:
 4. Are the entry and exit levels logical?
 5. Does it consider multiple timeframes?
 6. What could go wrong with this trade?
+
+Respond only with a JSON object of the form
+{"score": <integer 1-10>, "analysis": "<your review>", "risks": ["<risk>", ...]}
 """
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_params)
+        """Borrow a connection from the shared pool"""
+        return get_db_connection(self.db_params)
+    
+    def release_db_connection(self, conn):
+        """Return a borrowed connection; open transactions are rolled back"""
+        release_db_connection(self.db_params, conn)
     
     def validate_recommendation(self, recommendation_id):
         """Validate a specific recommendation"""
@@ -74,14 +154,24 @@ Focus on:
         if not recommendation:
             raise ValueError(f"Recommendation {recommendation_id} not found")
         
+        # Don't spend a GPT call on a recommendation without trade levels
+        if not self.has_required_fields(recommendation):
+            return self.record_insufficient_data(recommendation_id)
+        
         # Prepare the recommendation for validation
         recommendation_text = self.format_recommendation_for_validation(recommendation)
         
-        # Get Adam Grimes' perspective
-        validation = self.get_adam_grimes_perspective(recommendation_text)
+        # Reuse a previous validation of identical content before calling GPT
+        cache_key = validation_cache_key(recommendation)
+        validation = self.get_cached_validation(cache_key)
         
-        # Parse the validation
-        score, analysis = self.parse_validation(validation)
+        if validation is None:
+            # Get Adam Grimes' perspective
+            validation = self.get_adam_grimes_perspective(recommendation_text)
+            score, analysis = self.parse_validation(validation)
+            self.cache_validation(cache_key, validation, score)
+        else:
+            score, analysis = self.parse_validation(validation)
         
         # Save validation to database
         self.save_validation(recommendation_id, validation, score)
@@ -93,6 +183,180 @@ Focus on:
             'full_validation': validation
         }
     
+    def validate_stream(self, recommendation_ids):
+        """Validate recommendations one GPT call at a time, overlapping DB work
+        
+        A loader thread fetches and formats the next recommendation and a
+        writer thread parses and saves the previous one while the current
+        GPT request is in flight. Missing recommendations are reported in
+        the results instead of aborting the batch.
+        """
+        formatted = queue.Queue(maxsize=1)
+        validated = queue.Queue()
+        results = []
+        # Set when the GPT loop exits, so a loader blocked on a full queue can quit
+        stop = threading.Event()
+        
+        def hand_off(item):
+            while not stop.is_set():
+                try:
+                    formatted.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def load():
+            for recommendation_id in recommendation_ids:
+                try:
+                    recommendation = self.get_recommendation(recommendation_id)
+                    if not recommendation:
+                        raise ValueError(f"Recommendation {recommendation_id} not found")
+                    if not self.has_required_fields(recommendation):
+                        item = (recommendation_id, None, None)
+                    else:
+                        text = self.format_recommendation_for_validation(recommendation)
+                        item = (recommendation_id, text, validation_cache_key(recommendation))
+                except Exception as e:
+                    self.logger.error(f"Error loading recommendation {recommendation_id}: {e}")
+                    item = (recommendation_id, e, None)
+                if not hand_off(item):
+                    return
+            hand_off(None)
+        
+        def save():
+            while True:
+                item = validated.get()
+                if item is None:
+                    break
+                recommendation_id, validation, cache_key, cached = item
+                try:
+                    if isinstance(validation, Exception):
+                        raise validation
+                    if validation is None:
+                        results.append(self.record_insufficient_data(recommendation_id))
+                        continue
+                    score, analysis = self.parse_validation(validation)
+                    if not cached:
+                        self.cache_validation(cache_key, validation, score)
+                    self.save_validation(recommendation_id, validation, score)
+                    results.append({
+                        'recommendation_id': recommendation_id,
+                        'score': score,
+                        'analysis': analysis,
+                        'full_validation': validation
+                    })
+                except Exception as e:
+                    results.append({'recommendation_id': recommendation_id, 'error': str(e)})
+        
+        loader = threading.Thread(target=load, daemon=True)
+        writer = threading.Thread(target=save, daemon=True)
+        loader.start()
+        writer.start()
+        
+        try:
+            while True:
+                item = formatted.get()
+                if item is None:
+                    break
+                recommendation_id, text, cache_key = item
+                if text is None or isinstance(text, Exception):
+                    validated.put((recommendation_id, text, None, None))
+                    continue
+                try:
+                    validation = self.get_cached_validation(cache_key)
+                    cached = validation is not None
+                    if not cached:
+                        validation = self.get_adam_grimes_perspective(text)
+                except Exception as e:
+                    validation, cached = e, False
+                validated.put((recommendation_id, validation, cache_key, cached))
+        finally:
+            stop.set()
+            validated.put(None)
+            loader.join()
+            writer.join()
+        
+        return results
+    
+    async def validate_many(self, recommendation_ids, concurrency=8):
+        """Validate several recommendations with overlapping GPT requests
+        
+        Args:
+            recommendation_ids: Recommendation ids to validate
+            concurrency: Maximum number of GPT requests in flight
+        
+        Failures are reported per recommendation instead of aborting the batch.
+        """
+        sem = asyncio.Semaphore(concurrency)
+        # ThreadedConnectionPool raises instead of blocking when exhausted, so
+        # never run more DB calls at once than it has connections
+        with ThreadPoolExecutor(max_workers=POOL_MAXCONN) as db_executor:
+            outcomes = await asyncio.gather(
+                *(self.validate_recommendation_async(i, sem, db_executor) for i in recommendation_ids),
+                return_exceptions=True
+            )
+        
+        results = []
+        for recommendation_id, outcome in zip(recommendation_ids, outcomes):
+            if isinstance(outcome, Exception):
+                self.logger.error(f"Error validating recommendation {recommendation_id}: {outcome}")
+                outcome = {'recommendation_id': recommendation_id, 'error': str(outcome)}
+            results.append(outcome)
+        return results
+    
+    async def validate_recommendation_async(self, recommendation_id, sem, db_executor=None):
+        """Validate one recommendation; blocking DB work runs on db_executor"""
+        loop = asyncio.get_running_loop()
+        
+        def run_db(func, *args):
+            return loop.run_in_executor(db_executor, func, *args)
+        
+        recommendation = await run_db(self.get_recommendation, recommendation_id)
+        if not recommendation:
+            raise ValueError(f"Recommendation {recommendation_id} not found")
+        
+        if not self.has_required_fields(recommendation):
+            return await run_db(self.record_insufficient_data, recommendation_id)
+        
+        recommendation_text = self.format_recommendation_for_validation(recommendation)
+        
+        cache_key = validation_cache_key(recommendation)
+        validation = await run_db(self.get_cached_validation, cache_key)
+        
+        if validation is None:
+            async with sem:
+                validation = await self.get_adam_grimes_perspective_async(recommendation_text)
+            score, analysis = self.parse_validation(validation)
+            await run_db(self.cache_validation, cache_key, validation, score)
+        else:
+            score, analysis = self.parse_validation(validation)
+        await run_db(self.save_validation, recommendation_id, validation, score)
+        
+        return {
+            'recommendation_id': recommendation_id,
+            'score': score,
+            'analysis': analysis,
+            'full_validation': validation
+        }
+    
+    def has_required_fields(self, rec):
+        """Check that enough of the required trade fields are populated"""
+        missing = sum(rec.get(field) in (None, '') for field in REQUIRED_FIELDS)
+        return missing <= MAX_MISSING_FIELDS
+    
+    def record_insufficient_data(self, recommendation_id):
+        """Save a low default score for a recommendation that was not sent to GPT"""
+        self.logger.info(f"Skipping GPT validation for recommendation {recommendation_id}: insufficient data")
+        self.save_validation(recommendation_id, INSUFFICIENT_DATA_TEXT, INSUFFICIENT_DATA_SCORE)
+        
+        return {
+            'recommendation_id': recommendation_id,
+            'score': INSUFFICIENT_DATA_SCORE,
+            'analysis': INSUFFICIENT_DATA_TEXT,
+            'full_validation': INSUFFICIENT_DATA_TEXT
+        }
+    
     def get_recommendation(self, recommendation_id):
         """Get recommendation from database"""
         conn = self.get_db_connection()
@@ -100,7 +364,16 @@ Focus on:
         
         try:
             query = """
-                SELECT * FROM dhanhq.trading_recommendations
+                SELECT symbol, generated_at, current_price,
+                       trend_1min, trend_5min, trend_15min, trend_60min, trend_daily,
+                       resistance_1, resistance_2, resistance_3,
+                       support_1, support_2, support_3,
+                       intraday_action, intraday_entry, intraday_stoploss,
+                       intraday_target1, intraday_target2, intraday_risk_reward, intraday_rationale,
+                       swing_action, swing_entry, swing_stoploss,
+                       swing_target1, swing_target2, swing_target3, swing_risk_reward, swing_rationale,
+                       recommendation_text
+                FROM dhanhq.trading_recommendations
                 WHERE id = %s
             """
             cur.execute(query, (recommendation_id,))
@@ -115,59 +388,80 @@ Focus on:
                 
         finally:
             cur.close()
-            conn.close()
+            self.release_db_connection(conn)
+    
+    def get_cached_validation(self, cache_key):
+        """Return a cached validation for the hashed text, or None"""
+        conn = self.get_db_connection()
+        cur = conn.cursor()
+        
+        try:
+            cur.execute(
+                "SELECT full_validation FROM dhanhq.gpt_validation_cache WHERE cache_key = %s",
+                (cache_key,)
+            )
+            result = cur.fetchone()
+            return result[0] if result else None
+        finally:
+            cur.close()
+            self.release_db_connection(conn)
+    
+    def cache_validation(self, cache_key, validation_text, score):
+        """Store a validation under the hash of its recommendation text"""
+        conn = self.get_db_connection()
+        cur = conn.cursor()
+        
+        try:
+            cur.execute("""
+                INSERT INTO dhanhq.gpt_validation_cache (cache_key, score, full_validation)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (cache_key) DO NOTHING
+            """, (cache_key, score, validation_text))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.logger.error(f"Error caching validation: {e}")
+        finally:
+            cur.close()
+            self.release_db_connection(conn)
     
     def format_recommendation_for_validation(self, rec):
         """Format recommendation for GPT validation"""
-        text = f"""
-Trading Recommendation for {rec['symbol']}
-Generated: {rec['generated_at']}
-
-Current Market Context:
-- Price: ₹{rec['current_price']}
-- 1-min Trend: {rec['trend_1min']}
-- 5-min Trend: {rec['trend_5min']}
-- 15-min Trend: {rec['trend_15min']}
-- 60-min Trend: {rec['trend_60min']}
-- Daily Trend: {rec['trend_daily']}
-
-Support/Resistance Levels:
-- Resistance: R1=₹{rec['resistance_1']}, R2=₹{rec['resistance_2']}, R3=₹{rec['resistance_3']}
-- Support: S1=₹{rec['support_1']}, S2=₹{rec['support_2']}, S3=₹{rec['support_3']}
-
-Intraday Recommendation:
-- Action: {rec['intraday_action']}
-- Entry: ₹{rec['intraday_entry']}
-- Stop Loss: ₹{rec['intraday_stoploss']}
-- Target 1: ₹{rec['intraday_target1']}
-- Target 2: ₹{rec['intraday_target2']}
-- Risk/Reward: {rec['intraday_risk_reward']}
-- Rationale: {rec['intraday_rationale']}
-
-Swing Trading Recommendation:
-- Action: {rec['swing_action']}
-- Entry: ₹{rec['swing_entry']}
-- Stop Loss: ₹{rec['swing_stoploss']}
-- Targets: ₹{rec['swing_target1']}, ₹{rec['swing_target2']}, ₹{rec['swing_target3']}
-- Risk/Reward: {rec['swing_risk_reward']}
-- Rationale: {rec['swing_rationale']}
-
-Full Analysis:
-{rec['recommendation_text']}
-"""
-        return text
+        return REC_TEMPLATE.format_map(defaultdict(lambda: 'N/A', rec))
+    
+    def completion_kwargs(self, recommendation_text):
+        """Build the chat completion request for a recommendation"""
+        kwargs = {
+            'model': GPT_MODEL,
+            'messages': [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": f"Please review this trading recommendation:\n\n{recommendation_text}"}
+            ],
+            'temperature': 0.7,
+            'max_tokens': 1500
+        }
+        if GPT_MODEL.startswith(JSON_MODE_PREFIXES):
+            kwargs['response_format'] = {"type": "json_object"}
+        return kwargs
     
     def get_adam_grimes_perspective(self, recommendation_text):
         """Get Adam Grimes' perspective on the recommendation"""
         try:
             response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": f"Please review this trading recommendation:\n\n{recommendation_text}"}
-                ],
-                temperature=0.7,
-                max_tokens=1500
+                **self.completion_kwargs(recommendation_text)
+            )
+            
+            return response.choices[0].message.content
+            
+        except Exception as e:
+            self.logger.error(f"Error getting GPT validation: {e}")
+            raise
+    
+    async def get_adam_grimes_perspective_async(self, recommendation_text):
+        """Get Adam Grimes' perspective without blocking the event loop"""
+        try:
+            response = await self.aclient.chat.completions.create(
+                **self.completion_kwargs(recommendation_text)
             )
             
             return response.choices[0].message.content
@@ -178,30 +472,27 @@ Full Analysis:
     
     def parse_validation(self, validation_text):
         """Parse validation to extract score and key points"""
-        score = 5  # Default score
+        # Structured responses carry the score and analysis directly
+        if validation_text.lstrip().startswith('{'):
+            try:
+                obj = json.loads(validation_text)
+                return int(obj['score']), str(obj.get('analysis', ''))[:500]
+            except (ValueError, KeyError, TypeError):
+                pass
         
-        # Try to extract score from text
-        import re
-        
-        # Look for patterns like "7/10", "8 out of 10", "score: 7"
-        score_patterns = [
-            r'(\d+)/10',
-            r'(\d+)\s+out\s+of\s+10',
-            r'score[:\s]+(\d+)',
-            r'rating[:\s]+(\d+)'
-        ]
+        score = 5  # Default score
         
-        for pattern in score_patterns:
-            matches = re.findall(pattern, validation_text.lower())
-            if matches:
-                try:
-                    score = int(matches[0])
-                    break
-                except:
-                    pass
+        # Try to extract score from text; the score is usually stated early,
+        # so scan a bounded head first and only fall back to the full text
+        match = SCORE_RE.search(validation_text, 0, SCORE_SCAN_CHARS)
+        # A match that reaches the bound may be cut short ("score: 1" of "score: 10")
+        if (match is None or match.end() >= SCORE_SCAN_CHARS) and len(validation_text) > SCORE_SCAN_CHARS:
+            match = SCORE_RE.search(validation_text)
+        if match:
+            score = int(next(g for g in match.groups() if g))
         
         # Extract key points (first 500 chars for summary)
-        analysis = validation_text[:500] if len(validation_text) > 500 else validation_text
+        analysis = validation_text[:500]
         
         return score, analysis
     
@@ -235,7 +526,7 @@ Full Analysis:
             raise
         finally:
             cur.close()
-            conn.close()
+            self.release_db_connection(conn)
 
 if __name__ == "__main__":
     # Test the validator
@@ -244,4 +535,5 @@ if __name__ == "__main__":
     # This would validate the latest recommendation
     # You need to have a recommendation ID to test
     # result = validator.validate_recommendation(1)
-    # print(f"Validation result: {result}")
\ No newline at end of file
+    # print(f"Validation result: {result}")
+    # results = asyncio.run(validator.validate_many([1, 2, 3]))
\ No newline at end of file
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Optional numba support shared by the price-analysis kernels
+Without numba the kernels run as plain Python/NumPy
+"""
+
+try:
+    from numba import njit, prange
+except ImportError:
+    prange = range
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
@@ -5,6 +5,9 @@ Generates trading recommendations and stores them in database
 """
 
 import os
+import re
+import itertools
+import weakref
 import psycopg2
 import pandas as pd
 import numpy as np
@@ -14,10 +17,76 @@ from dotenv import load_dotenv
 import logging
 from src.trend_detector import SimpleTrendDetector
 from src.simple_sr_detector import SimpleSRDetector as SupportResistanceDetector
+from src.db_pool import get_db_connection, release_db_connection
 # from src.askgpt_integration import TradingGPTAdvisor  # Temporarily disabled
 
 load_dotenv()
 
+# Price levels quoted in GPT recommendation text (matched against lowercased text)
+ENTRY_RE = re.compile(r'entry[:\s]+₹?([\d,]+\.?\d*)')
+STOP_LOSS_RE = re.compile(r'stop\s*loss[:\s]+₹?([\d,]+\.?\d*)')
+TARGET_RE = re.compile(r'target[:\s]+₹?([\d,]+\.?\d*)')
+
+# Parsed and planned once per pooled connection; parameter types come from
+# the target columns
+INSERT_RECOMMENDATION_SQL = """
+    PREPARE insert_recommendation AS
+    INSERT INTO dhanhq.trading_recommendations (
+        security_id, symbol, generated_at, current_price,
+        trend_1min, trend_5min, trend_15min, trend_60min,
+        trend_daily, trend_weekly, trend_monthly,
+        support_1, support_2, support_3,
+        resistance_1, resistance_2, resistance_3,
+        intraday_action, intraday_entry, intraday_stoploss,
+        intraday_target1, intraday_target2, intraday_risk_reward,
+        intraday_rationale,
+        swing_action, swing_entry, swing_stoploss,
+        swing_target1, swing_target2, swing_target3,
+        swing_risk_reward, swing_rationale,
+        recommendation_text, confidence_score
+    ) VALUES (
+        $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11,
+        $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, $22,
+        $23, $24, $25, $26, $27, $28, $29, $30, $31, $32, $33, $34
+    )
+    RETURNING id
+"""
+
+# Pooled connections that already hold the prepared insert
+PREPARED_CONNS = weakref.WeakSet()
+
+# Latest N bars per timeframe, returned oldest first; keyed by interval with
+# None covering the intraday intervals stored in price_data
+LATEST_DATA_SQL = """
+    SELECT * FROM (
+        SELECT {datetime} as datetime, open, high, low, close, volume
+        FROM dhanhq.{table}
+        WHERE security_id = %(security_id)s{where}
+        ORDER BY {order}
+        LIMIT %(limit)s
+    ) latest
+    ORDER BY datetime
+"""
+LATEST_DATA_QUERIES = {
+    'daily': LATEST_DATA_SQL.format(
+        datetime='date', table='price_data_daily', where='', order='date DESC'),
+    'weekly': LATEST_DATA_SQL.format(
+        datetime='week_end_date', table='price_data_weekly', where='', order='week_end_date DESC'),
+    'monthly': LATEST_DATA_SQL.format(
+        datetime='last_date', table='price_data_monthly', where='', order='year DESC, month DESC'),
+    None: LATEST_DATA_SQL.format(
+        datetime='datetime', table='price_data',
+        where=' AND interval_minutes = %(interval)s', order='datetime DESC'),
+}
+
+# Fields returned by get_latest_recommendation
+LATEST_RECOMMENDATION_COLUMNS = ('id', 'generated_at', 'current_price', 'intraday_action',
+                                 'confidence_score', 'recommendation_text')
+
+# Timeframes reported by get_current_trends, in display order
+INTRADAY_TREND_INTERVALS = [1, 5, 15, 60]
+TREND_TIMEFRAMES = [f'{i}min' for i in INTRADAY_TREND_INTERVALS] + ['daily', 'weekly', 'monthly']
+
 class RecommendationGenerator:
     def __init__(self):
         """Initialize the recommendation generator"""
@@ -39,102 +108,114 @@ class RecommendationGenerator:
         
         # Initialize detectors (will pass connection when needed)
         self.sr_detector = SupportResistanceDetector()
-        # self.gpt_advisor = TradingGPTAdvisor()  # Temporarily disabled
+        self.gpt_advisor = None  # TradingGPTAdvisor() - temporarily disabled
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_params)
+        """Borrow a connection from the shared pool"""
+        return get_db_connection(self.db_params)
+    
+    def release_db_connection(self, conn):
+        """Return a borrowed connection; open transactions are rolled back"""
+        release_db_connection(self.db_params, conn)
+    
+    def prepare_statements(self, conn):
+        """Define the recommendation insert once per pooled connection"""
+        if conn in PREPARED_CONNS:
+            return
+        
+        with conn.cursor() as cur:
+            cur.execute(INSERT_RECOMMENDATION_SQL)
+        PREPARED_CONNS.add(conn)
     
     def get_latest_data(self, interval_minutes, limit=500):
-        """Get latest price data for analysis"""
+        """Get latest OHLCV bars for analysis; trends come from get_current_trends"""
         conn = self.get_db_connection()
         cur = conn.cursor()
         
         try:
-            if interval_minutes == 'daily':
-                query = """
-                    SELECT date as datetime, open, high, low, close, volume,
-                           simple_trend, simple_trend_strength
-                    FROM dhanhq.price_data_daily
-                    WHERE security_id = %s
-                    ORDER BY date DESC
-                    LIMIT %s
-                """
-                cur.execute(query, (self.security_id, limit))
-            elif interval_minutes == 'weekly':
-                query = """
-                    SELECT week_end_date as datetime, open, high, low, close, volume,
-                           simple_trend, simple_trend_strength
-                    FROM dhanhq.price_data_weekly
-                    WHERE security_id = %s
-                    ORDER BY week_end_date DESC
-                    LIMIT %s
-                """
-                cur.execute(query, (self.security_id, limit))
-            elif interval_minutes == 'monthly':
-                query = """
-                    SELECT last_date as datetime, open, high, low, close, volume,
-                           simple_trend, simple_trend_strength
-                    FROM dhanhq.price_data_monthly
-                    WHERE security_id = %s
-                    ORDER BY year DESC, month DESC
-                    LIMIT %s
-                """
-                cur.execute(query, (self.security_id, limit))
-            else:
-                query = """
-                    SELECT datetime, open, high, low, close, volume,
-                           simple_trend, simple_trend_strength
-                    FROM dhanhq.price_data
-                    WHERE security_id = %s AND interval_minutes = %s
-                    ORDER BY datetime DESC
-                    LIMIT %s
-                """
-                cur.execute(query, (self.security_id, interval_minutes, limit))
+            query = LATEST_DATA_QUERIES.get(interval_minutes, LATEST_DATA_QUERIES[None])
+            cur.execute(query, {
+                'security_id': self.security_id,
+                'interval': interval_minutes,
+                'limit': limit
+            })
             
-            columns = ['datetime', 'open', 'high', 'low', 'close', 'volume', 
-                      'simple_trend', 'simple_trend_strength']
+            columns = ['datetime', 'open', 'high', 'low', 'close', 'volume']
             data = cur.fetchall()
             
             if data:
-                df = pd.DataFrame(data, columns=columns)
-                df = df.sort_values('datetime').reset_index(drop=True)
-                return df
+                # Rows already arrive oldest first
+                return pd.DataFrame(data, columns=columns)
             else:
                 return pd.DataFrame()
                 
         finally:
             cur.close()
-            conn.close()
+            self.release_db_connection(conn)
     
     def get_current_trends(self):
-        """Get current trends for all timeframes"""
-        trends = {}
-        
-        timeframes = [
-            (1, '1min'),
-            (5, '5min'),
-            (15, '15min'),
-            (60, '60min'),
-            ('daily', 'daily'),
-            ('weekly', 'weekly'),
-            ('monthly', 'monthly')
-        ]
-        
-        for interval, name in timeframes:
-            df = self.get_latest_data(interval, limit=10)
-            if not df.empty and 'simple_trend' in df.columns:
-                latest_trend = df.iloc[-1]['simple_trend']
-                trends[f'trend_{name}'] = latest_trend
-            else:
-                trends[f'trend_{name}'] = 'UNKNOWN'
+        """Get current trends for all timeframes
+        
+        Returns:
+            Tuple of (trends, uptrends, downtrends)
+        """
+        trends = {f'trend_{name}': 'UNKNOWN' for name in TREND_TIMEFRAMES}
         
-        return trends
+        conn = self.get_db_connection()
+        cur = conn.cursor()
+        
+        try:
+            # Latest trend per timeframe in one round-trip; the LATERAL LIMIT 1
+            # walks the (security_id, interval_minutes, datetime) index per interval
+            cur.execute("""
+                WITH latest AS (
+                    SELECT 'trend_' || iv || 'min' AS name, t.simple_trend
+                    FROM unnest(%(intervals)s::int[]) AS iv
+                    CROSS JOIN LATERAL (
+                        SELECT simple_trend FROM dhanhq.price_data
+                        WHERE security_id = %(security_id)s AND interval_minutes = iv
+                        ORDER BY datetime DESC
+                        LIMIT 1
+                    ) t
+                    UNION ALL
+                    (SELECT 'trend_daily', simple_trend FROM dhanhq.price_data_daily
+                     WHERE security_id = %(security_id)s
+                     ORDER BY date DESC LIMIT 1)
+                    UNION ALL
+                    (SELECT 'trend_weekly', simple_trend FROM dhanhq.price_data_weekly
+                     WHERE security_id = %(security_id)s
+                     ORDER BY week_end_date DESC LIMIT 1)
+                    UNION ALL
+                    (SELECT 'trend_monthly', simple_trend FROM dhanhq.price_data_monthly
+                     WHERE security_id = %(security_id)s
+                     ORDER BY year DESC, month DESC LIMIT 1)
+                )
+                SELECT name, simple_trend,
+                       COUNT(*) FILTER (WHERE simple_trend = 'UPTREND') OVER (),
+                       COUNT(*) FILTER (WHERE simple_trend = 'DOWNTREND') OVER ()
+                FROM latest
+            """, {'security_id': self.security_id, 'intervals': INTRADAY_TREND_INTERVALS})
+            
+            rows = cur.fetchall()
+            trends.update((name, trend) for name, trend, _, _ in rows)
+            
+            # Alignment counts used by the action, confidence and text helpers
+            uptrends, downtrends = rows[0][2:] if rows else (0, 0)
+            return trends, uptrends, downtrends
+            
+        finally:
+            cur.close()
+            self.release_db_connection(conn)
     
-    def calculate_support_resistance(self):
-        """Calculate support and resistance levels"""
+    def calculate_support_resistance(self, df=None):
+        """Calculate support and resistance levels
+        
+        Args:
+            df: 15-minute bars to analyse; fetched (200 bars) when not given
+        """
         # Get 15-minute data for S/R calculation
-        df = self.get_latest_data(15, limit=200)
+        if df is None:
+            df = self.get_latest_data(15, limit=200)
         
         if df.empty:
             return {
@@ -171,40 +252,46 @@ class RecommendationGenerator:
         """Generate a complete trading recommendation"""
         self.logger.info("Generating trading recommendation...")
         
-        # Get current market data
-        df_15min = self.get_latest_data(15, limit=100)
+        # Get current market data; one fetch serves both context and S/R
+        df_15min = self.get_latest_data(15, limit=200)
         if df_15min.empty:
             raise ValueError("No data available for analysis")
         
         current_price = float(df_15min.iloc[-1]['close'])
         
         # Get trends
-        trends = self.get_current_trends()
+        trends, uptrends, downtrends = self.get_current_trends()
         
         # Get S/R levels
-        sr_levels = self.calculate_support_resistance()
+        sr_levels = self.calculate_support_resistance(df_15min)
         
         # Prepare market context for GPT
         market_context = {
             'symbol': self.symbol,
             'current_price': current_price,
             'trends': trends,
+            'uptrends': uptrends,
+            'downtrends': downtrends,
             'support_levels': [sr_levels['support_1'], sr_levels['support_2'], sr_levels['support_3']],
-            'resistance_levels': [sr_levels['resistance_1'], sr_levels['resistance_2'], sr_levels['resistance_3']],
-            'recent_price_action': df_15min.tail(20)[['datetime', 'open', 'high', 'low', 'close', 'volume']].to_dict('records')
+            'resistance_levels': [sr_levels['resistance_1'], sr_levels['resistance_2'], sr_levels['resistance_3']]
         }
         
+        # Only the GPT advisor reads recent bars; skip the conversion without it
+        if self.gpt_advisor:
+            market_context['recent_price_action'] = df_15min.tail(20).to_dict('records')
+        
         # Generate recommendation based on trends and S/R
         recommendation_text = self.generate_simple_recommendation(market_context)
         
         # Create recommendation data
+        stop_loss, target_1, target_2 = self.calculate_trade_levels(current_price, sr_levels)
         recommendation_data = {
-            'action': self.determine_action(trends, sr_levels, current_price),
+            'action': self.determine_action(uptrends, downtrends),
             'entry_price': current_price,
-            'stop_loss': self.calculate_stop_loss(current_price, sr_levels),
-            'target_1': self.calculate_target(current_price, sr_levels, 1),
-            'target_2': self.calculate_target(current_price, sr_levels, 2),
-            'confidence': self.calculate_confidence(trends)
+            'stop_loss': stop_loss,
+            'target_1': target_1,
+            'target_2': target_2,
+            'confidence': self.calculate_confidence(uptrends, downtrends, len(trends))
         }
         
         # Add additional fields
@@ -222,46 +309,40 @@ class RecommendationGenerator:
     
     def generate_simple_recommendation(self, context):
         """Generate a simple text recommendation based on market context"""
-        trends = context['trends']
         current_price = context['current_price']
         support = context['support_levels']
         resistance = context['resistance_levels']
+        uptrends = context['uptrends']
+        downtrends = context['downtrends']
         
-        # Count trend alignment
-        uptrends = sum(1 for k, v in trends.items() if v == 'UPTREND')
-        downtrends = sum(1 for k, v in trends.items() if v == 'DOWNTREND')
-        
-        recommendation = f"""Trading Recommendation for {context['symbol']}
+        parts = [f"""Trading Recommendation for {context['symbol']}
 
 Current Price: ₹{current_price:.2f}
 
 Trend Analysis:
-"""
+"""]
         
         if uptrends > downtrends:
-            recommendation += "• Overall BULLISH bias - Multiple timeframes showing uptrend\n"
-            recommendation += "• Consider LONG positions on pullbacks to support\n"
+            parts.append("• Overall BULLISH bias - Multiple timeframes showing uptrend\n"
+                         "• Consider LONG positions on pullbacks to support\n")
         elif downtrends > uptrends:
-            recommendation += "• Overall BEARISH bias - Multiple timeframes showing downtrend\n"
-            recommendation += "• Consider SHORT positions on rallies to resistance\n"
+            parts.append("• Overall BEARISH bias - Multiple timeframes showing downtrend\n"
+                         "• Consider SHORT positions on rallies to resistance\n")
         else:
-            recommendation += "• NEUTRAL market - Mixed signals across timeframes\n"
-            recommendation += "• Wait for clearer trend alignment\n"
+            parts.append("• NEUTRAL market - Mixed signals across timeframes\n"
+                         "• Wait for clearer trend alignment\n")
         
         # Add S/R levels
-        recommendation += f"\nKey Levels:\n"
+        parts.append("\nKey Levels:\n")
         if resistance[0]:
-            recommendation += f"• Resistance: ₹{resistance[0]:.2f}\n"
+            parts.append(f"• Resistance: ₹{resistance[0]:.2f}\n")
         if support[0]:
-            recommendation += f"• Support: ₹{support[0]:.2f}\n"
+            parts.append(f"• Support: ₹{support[0]:.2f}\n")
         
-        return recommendation
+        return ''.join(parts)
     
-    def determine_action(self, trends, sr_levels, current_price):
-        """Determine trading action based on trends"""
-        uptrends = sum(1 for k, v in trends.items() if v == 'UPTREND')
-        downtrends = sum(1 for k, v in trends.items() if v == 'DOWNTREND')
-        
+    def determine_action(self, uptrends, downtrends):
+        """Determine trading action based on trend alignment"""
         if uptrends > downtrends:
             return 'BUY'
         elif downtrends > uptrends:
@@ -269,34 +350,25 @@ Trend Analysis:
         else:
             return 'HOLD'
     
-    def calculate_stop_loss(self, current_price, sr_levels):
-        """Calculate stop loss based on support levels"""
-        if sr_levels.get('support_1'):
-            return sr_levels['support_1'] * 0.995  # 0.5% below support
-        else:
-            return current_price * 0.98  # 2% stop loss
+    def calculate_trade_levels(self, current_price, sr_levels):
+        """Calculate stop loss and two targets from the nearest S/R levels
+        
+        Returns:
+            Tuple of (stop_loss, target_1, target_2)
+        """
+        s1 = sr_levels.get('support_1')
+        r1 = sr_levels.get('resistance_1')
+        r2 = sr_levels.get('resistance_2')
+        
+        stop_loss = s1 * 0.995 if s1 else current_price * 0.98  # 0.5% below support, else 2% stop
+        target_1 = r1 * 0.995 if r1 else current_price * 1.01   # Just below resistance, else 1%
+        target_2 = r2 * 0.995 if r2 else current_price * 1.02   # else 2%
+        return stop_loss, target_1, target_2
     
-    def calculate_target(self, current_price, sr_levels, target_num):
-        """Calculate target prices based on resistance levels"""
-        if target_num == 1 and sr_levels.get('resistance_1'):
-            return sr_levels['resistance_1'] * 0.995  # Just below resistance
-        elif target_num == 2 and sr_levels.get('resistance_2'):
-            return sr_levels['resistance_2'] * 0.995
-        else:
-            # Default targets
-            if target_num == 1:
-                return current_price * 1.01  # 1% target
-            else:
-                return current_price * 1.02  # 2% target
-    
-    def calculate_confidence(self, trends):
+    def calculate_confidence(self, uptrends, downtrends, total_trends):
         """Calculate confidence score based on trend alignment"""
-        trend_values = list(trends.values())
-        uptrends = trend_values.count('UPTREND')
-        downtrends = trend_values.count('DOWNTREND')
-        
         # Max alignment gives high confidence
-        alignment = max(uptrends, downtrends) / len(trend_values) if trend_values else 0
+        alignment = max(uptrends, downtrends) / total_trends if total_trends else 0
         return round(alignment * 100, 1)
     
     def parse_gpt_recommendation(self, text, context):
@@ -334,38 +406,29 @@ Trend Analysis:
             if 'swing' in text_lower:
                 data['swing_action'] = 'BUY'
         
-        # Extract price levels using regex (simplified)
-        import re
-        
-        # Look for entry points
-        entry_pattern = r'entry[:\s]+₹?([\d,]+\.?\d*)'
-        matches = re.findall(entry_pattern, text_lower)
-        if matches:
+        # Extract price levels using regex (simplified); only the first
+        # entry/stop and first two targets are used, so stop scanning early
+        match = ENTRY_RE.search(text_lower)
+        if match:
             try:
-                entry_price = float(matches[0].replace(',', ''))
-                data['intraday_entry'] = entry_price
-            except:
+                data['intraday_entry'] = float(match.group(1).replace(',', ''))
+            except ValueError:
                 pass
         
-        # Look for stop loss
-        sl_pattern = r'stop\s*loss[:\s]+₹?([\d,]+\.?\d*)'
-        matches = re.findall(sl_pattern, text_lower)
-        if matches:
+        match = STOP_LOSS_RE.search(text_lower)
+        if match:
             try:
-                sl_price = float(matches[0].replace(',', ''))
-                data['intraday_stoploss'] = sl_price
-            except:
+                data['intraday_stoploss'] = float(match.group(1).replace(',', ''))
+            except ValueError:
                 pass
         
-        # Look for targets
-        target_pattern = r'target[:\s]+₹?([\d,]+\.?\d*)'
-        matches = re.findall(target_pattern, text_lower)
-        if matches:
+        targets = [m.group(1) for m in itertools.islice(TARGET_RE.finditer(text_lower), 2)]
+        if targets:
             try:
-                data['intraday_target1'] = float(matches[0].replace(',', ''))
-                if len(matches) > 1:
-                    data['intraday_target2'] = float(matches[1].replace(',', ''))
-            except:
+                data['intraday_target1'] = float(targets[0].replace(',', ''))
+                if len(targets) > 1:
+                    data['intraday_target2'] = float(targets[1].replace(',', ''))
+            except ValueError:
                 pass
         
         # Extract rationale (first paragraph after "Intraday" or "Swing")
@@ -382,28 +445,6 @@ Trend Analysis:
         cur = conn.cursor()
         
         try:
-            insert_query = """
-                INSERT INTO dhanhq.trading_recommendations (
-                    security_id, symbol, generated_at, current_price,
-                    trend_1min, trend_5min, trend_15min, trend_60min,
-                    trend_daily, trend_weekly, trend_monthly,
-                    support_1, support_2, support_3,
-                    resistance_1, resistance_2, resistance_3,
-                    intraday_action, intraday_entry, intraday_stoploss,
-                    intraday_target1, intraday_target2, intraday_risk_reward,
-                    intraday_rationale,
-                    swing_action, swing_entry, swing_stoploss,
-                    swing_target1, swing_target2, swing_target3,
-                    swing_risk_reward, swing_rationale,
-                    recommendation_text, confidence_score
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                )
-                RETURNING id
-            """
-            
             values = (
                 recommendation['security_id'],
                 recommendation['symbol'],
@@ -441,7 +482,8 @@ Trend Analysis:
                 recommendation.get('confidence')  # confidence_score
             )
             
-            cur.execute(insert_query, values)
+            self.prepare_statements(conn)
+            cur.execute(f"EXECUTE insert_recommendation ({', '.join(['%s'] * len(values))})", values)
             recommendation_id = cur.fetchone()[0]
             conn.commit()
             
@@ -454,7 +496,7 @@ Trend Analysis:
             raise
         finally:
             cur.close()
-            conn.close()
+            self.release_db_connection(conn)
     
     def get_latest_recommendation(self):
         """Get the most recent recommendation from database"""
@@ -462,25 +504,25 @@ Trend Analysis:
         cur = conn.cursor()
         
         try:
-            query = """
-                SELECT * FROM dhanhq.trading_recommendations
+            query = f"""
+                SELECT {', '.join(LATEST_RECOMMENDATION_COLUMNS)}
+                FROM dhanhq.trading_recommendations
                 WHERE security_id = %s
                 ORDER BY generated_at DESC
                 LIMIT 1
             """
             cur.execute(query, (self.security_id,))
             
-            columns = [desc[0] for desc in cur.description]
             result = cur.fetchone()
             
             if result:
-                return dict(zip(columns, result))
+                return dict(zip(LATEST_RECOMMENDATION_COLUMNS, result))
             else:
                 return None
                 
         finally:
             cur.close()
-            conn.close()
+            self.release_db_connection(conn)
 
 if __name__ == "__main__":
     # Test the generator
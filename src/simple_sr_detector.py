@@ -8,12 +8,111 @@ Simple Support/Resistance Detection based on Adam Grimes' principles
 
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from dataclasses import dataclass
 from typing import List, Tuple, Optional
 import logging
+import math
+from functools import lru_cache
+from operator import itemgetter
+
+from .jit import njit
+
+# Optional: bottleneck's moving mean; pandas rolling is used without it
+try:
+    import bottleneck as bn
+except ImportError:
+    bn = None
+
+# Optional: scipy's compiled extrema search; NumPy windows are used without it
+try:
+    from scipy.signal import argrelextrema
+except ImportError:
+    argrelextrema = None
 
 logger = logging.getLogger(__name__)
 
+# Candidate levels are ranked as one array; only the returned top N become
+# SimpleSRLevel objects. Dates keep whatever type the frame supplied.
+SR_LEVEL_DTYPE = np.dtype([
+    ('price', np.float64),
+    ('touches', np.int64),
+    ('is_round_number', np.bool_),
+    ('first_seen', object),
+    ('last_seen', object),
+])
+
+
+def swing_point_flags(highs: np.ndarray, lows: np.ndarray, window: int):
+    """Flag bars whose high/low is a strict extreme of `window` bars on each side"""
+    n = len(highs)
+    is_high = np.zeros(n, dtype=np.bool_)
+    is_low = np.zeros(n, dtype=np.bool_)
+    if n < 2 * window + 1:
+        return is_high, is_low
+    
+    if argrelextrema is not None:
+        # Strict comparison against `window` bars each side; edges clip, so trim them
+        is_high[argrelextrema(highs, np.greater, order=window)[0]] = True
+        is_low[argrelextrema(lows, np.less, order=window)[0]] = True
+        is_high[:window] = is_high[n - window:] = False
+        is_low[:window] = is_low[n - window:] = False
+        return is_high, is_low
+    
+    # Extremes of every `window`-bar run; bar i's left run starts at i-window,
+    # its right run at i+1
+    high_max = sliding_window_view(highs, window).max(axis=1)
+    low_min = sliding_window_view(lows, window).min(axis=1)
+    inner = slice(window, n - window)
+    left = slice(0, n - 2 * window)
+    right = slice(window + 1, n - window + 1)
+    
+    is_high[inner] = (highs[inner] > high_max[left]) & (highs[inner] > high_max[right])
+    is_low[inner] = (lows[inner] < low_min[left]) & (lows[inner] < low_min[right])
+    
+    return is_high, is_low
+
+
+@lru_cache(maxsize=2048)
+def round_numbers_between(min_price: int, max_price: int, increment: int) -> Tuple[int, ...]:
+    """Multiples of 10x increment within [min_price, max_price]"""
+    round_numbers = []
+    
+    # Find round numbers in range
+    start = int(min_price / increment) * increment
+    current = start
+    
+    while current <= max_price:
+        if min_price <= current <= max_price:
+            # Extra round numbers (multiples of 10x increment) are more significant
+            if current % (increment * 10) == 0:
+                round_numbers.append(current)
+        current += increment
+    
+    return tuple(round_numbers)
+
+
+@njit(cache=True)
+def cluster_labels(prices: np.ndarray, threshold: float) -> np.ndarray:
+    """Label ascending prices by cluster; a price joins the current cluster
+    when it is within threshold of that cluster's mean"""
+    labels = np.zeros(len(prices), dtype=np.int64)
+    label = 0
+    total = prices[0]
+    count = 1
+    
+    for i in range(1, len(prices)):
+        if abs(prices[i] - total / count) <= threshold:
+            total += prices[i]
+            count += 1
+        else:
+            label += 1
+            total = prices[i]
+            count = 1
+        labels[i] = label
+    
+    return labels
+
 @dataclass
 class SimpleSRLevel:
     """Simple representation of a support/resistance level"""
@@ -58,18 +157,25 @@ class SimpleSRDetector:
         
     def calculate_atr(self, df: pd.DataFrame, period: int = 14) -> pd.Series:
         """Calculate Average True Range"""
-        high = df['high']
-        low = df['low']
-        close = df['close'].shift(1)
-        
-        tr1 = high - low
-        tr2 = abs(high - close)
-        tr3 = abs(low - close)
-        
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        atr = tr.rolling(window=period).mean()
+        high = df['high'].to_numpy(dtype=np.float64)
+        low = df['low'].to_numpy(dtype=np.float64)
+        close = np.empty_like(high)
+        close[0:1] = np.nan
+        close[1:] = df['close'].to_numpy(dtype=np.float64)[:-1]
+        
+        # fmax skips the missing prior close on the first bar, as the row-wise max did
+        tr = np.fmax.reduce([high - low, np.abs(high - close), np.abs(low - close)])
+        if bn is not None:
+            atr = bn.move_mean(tr, window=period)
+        else:
+            atr = pd.Series(tr).rolling(window=period).mean().to_numpy()
         
-        return atr
+        return pd.Series(atr, index=df.index)
+    
+    def latest_atr(self, df: pd.DataFrame, period: int = 14) -> float:
+        """Last ATR value of df"""
+        # The last value only needs `period` true ranges, each with its prior close
+        return float(self.calculate_atr(df.tail(period + 1), period).iloc[-1])
     
     def find_swing_points(self, df: pd.DataFrame) -> Tuple[List[dict], List[dict]]:
         """Find swing highs and lows using simple peak/valley detection"""
@@ -81,39 +187,32 @@ class SimpleSRDetector:
             return highs, lows
         
         # Use last lookback_bars of data
-        recent_df = df.tail(self.lookback_bars).reset_index()
-        
-        # Simple swing detection - look for local extremes
-        for i in range(5, len(recent_df) - 5):  # Need 5 bars on each side
-            # Swing high: higher than 5 bars before and after
-            if (recent_df.iloc[i]['high'] > recent_df.iloc[i-5:i]['high'].max() and
-                recent_df.iloc[i]['high'] > recent_df.iloc[i+1:i+6]['high'].max()):
-                
-                highs.append({
-                    'index': i,
-                    'price': float(recent_df.iloc[i]['high']),
-                    'date': recent_df.iloc[i].name if recent_df.index.name else recent_df.iloc[i].get('datetime', recent_df.index[i])
-                })
-            
-            # Swing low: lower than 5 bars before and after
-            if (recent_df.iloc[i]['low'] < recent_df.iloc[i-5:i]['low'].min() and
-                recent_df.iloc[i]['low'] < recent_df.iloc[i+1:i+6]['low'].min()):
-                
-                lows.append({
-                    'index': i,
-                    'price': float(recent_df.iloc[i]['low']),
-                    'date': recent_df.iloc[i].name if recent_df.index.name else recent_df.iloc[i].get('datetime', recent_df.index[i])
-                })
+        recent_df = df.tail(self.lookback_bars)
+        if 'datetime' in recent_df.columns:
+            dates = recent_df['datetime'].tolist()
+        elif recent_df.index.name == 'datetime':
+            dates = recent_df.index.tolist()
+        else:
+            dates = list(range(len(recent_df)))
+        
+        # Simple swing detection - look for local extremes (5 bars on each side)
+        high_prices = recent_df['high'].to_numpy(dtype=np.float64)
+        low_prices = recent_df['low'].to_numpy(dtype=np.float64)
+        is_high, is_low = swing_point_flags(high_prices, low_prices, 5)
+        
+        for i in np.flatnonzero(is_high):
+            highs.append({'index': int(i), 'price': float(high_prices[i]), 'date': dates[i]})
+        for i in np.flatnonzero(is_low):
+            lows.append({'index': int(i), 'price': float(low_prices[i]), 'date': dates[i]})
         
         return highs, lows
     
-    def find_round_numbers(self, price_range: Tuple[float, float]) -> List[float]:
+    def find_round_numbers(self, price_range: Tuple[float, float]) -> Tuple[int, ...]:
         """Find psychological round numbers in price range"""
         if not self.include_round_numbers:
-            return []
+            return ()
         
         min_price, max_price = price_range
-        round_numbers = []
         
         # Determine appropriate increment based on price level
         if max_price > 10000:
@@ -125,18 +224,8 @@ class SimpleSRDetector:
         else:
             increment = 1    # For penny stocks
         
-        # Find round numbers in range
-        start = int(min_price / increment) * increment
-        current = start
-        
-        while current <= max_price:
-            if min_price <= current <= max_price:
-                # Extra round numbers (multiples of 10x increment) are more significant
-                if current % (increment * 10) == 0:
-                    round_numbers.append(current)
-            current += increment
-        
-        return round_numbers
+        # Candidates are integers, so whole-number bounds select the same ones
+        return round_numbers_between(math.ceil(min_price), math.floor(max_price), increment)
     
     def cluster_levels(self, levels: List[dict], atr: float) -> List[dict]:
         """Cluster nearby levels based on ATR"""
@@ -144,52 +233,54 @@ class SimpleSRDetector:
             return []
         
         # Sort by price
-        sorted_levels = sorted(levels, key=lambda x: x['price'])
-        clusters = []
-        current_cluster = [sorted_levels[0]]
-        cluster_threshold = atr * self.cluster_threshold_atr
-        
-        for level in sorted_levels[1:]:
-            cluster_center = np.mean([l['price'] for l in current_cluster])
-            
-            if abs(level['price'] - cluster_center) <= cluster_threshold:
-                current_cluster.append(level)
-            else:
-                # Process current cluster
-                clusters.append(self._merge_cluster(current_cluster))
-                current_cluster = [level]
-        
-        # Don't forget last cluster
-        if current_cluster:
-            clusters.append(self._merge_cluster(current_cluster))
-        
-        return clusters
+        sorted_levels = sorted(levels, key=itemgetter('price'))
+        prices = np.array([l['price'] for l in sorted_levels], dtype=np.float64)
+        labels = cluster_labels(prices, atr * self.cluster_threshold_atr)
+        
+        # Labels are non-decreasing, so each cluster is a contiguous run
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1))
+        ends = np.append(starts[1:], len(sorted_levels))
+        sums = np.add.reduceat(prices, starts)
+        return [self._merge_cluster(sorted_levels[a:b], total, b - a)
+                for a, b, total in zip(starts.tolist(), ends.tolist(), sums.tolist())]
     
-    def _merge_cluster(self, cluster: List[dict]) -> dict:
+    def _merge_cluster(self, cluster: List[dict], price_sum: float, count: int) -> dict:
         """Merge levels in a cluster into single level"""
-        avg_price = np.mean([l['price'] for l in cluster])
-        touches = len(cluster)
-        dates = [l.get('date') for l in cluster if l.get('date') is not None]
+        first_seen = last_seen = None
+        for level in cluster:
+            date = level.get('date')
+            if date is None:
+                continue
+            if first_seen is None or date < first_seen:
+                first_seen = date
+            if last_seen is None or date > last_seen:
+                last_seen = date
         
         return {
-            'price': avg_price,
-            'touches': touches,
-            'first_seen': min(dates) if dates else None,
-            'last_seen': max(dates) if dates else None
+            'price': price_sum / count,
+            'touches': count,
+            'first_seen': first_seen,
+            'last_seen': last_seen
         }
     
     def count_touches(self, df: pd.DataFrame, level_price: float, atr: float) -> int:
         """Count how many times price touched a level"""
+        return int(self.count_touches_many(df, [level_price], atr)[0])
+    
+    def count_touches_many(self, df: pd.DataFrame, level_prices, atr: float) -> np.ndarray:
+        """Count touches of every level in one pass over sorted highs/lows"""
         threshold = atr * self.cluster_threshold_atr
+        levels = np.asarray(level_prices, dtype=np.float64)
+        lo = levels - threshold
+        hi = levels + threshold
         
-        # Check both highs and lows near the level
-        high_touches = ((df['high'] >= level_price - threshold) & 
-                       (df['high'] <= level_price + threshold)).sum()
-        
-        low_touches = ((df['low'] >= level_price - threshold) & 
-                      (df['low'] <= level_price + threshold)).sum()
+        # Check both highs and lows near each level
+        touches = np.zeros(len(levels), dtype=np.int64)
+        for column in ('high', 'low'):
+            prices = np.sort(df[column].to_numpy(dtype=np.float64))
+            touches += np.searchsorted(prices, hi, 'right') - np.searchsorted(prices, lo, 'left')
         
-        return high_touches + low_touches
+        return touches
     
     def detect_sr_levels(self, df: pd.DataFrame, 
                         max_support: int = 3, 
@@ -204,11 +295,9 @@ class SimpleSRDetector:
             return [], []
         
         # Calculate ATR for clustering
-        atr = self.calculate_atr(df).iloc[-1]
+        atr = self.latest_atr(df)
         if pd.isna(atr):
             atr = float(df['high'].std())  # Fallback to standard deviation
-        else:
-            atr = float(atr)
         
         current_price = float(df.iloc[-1]['close'])
         
@@ -216,69 +305,76 @@ class SimpleSRDetector:
         highs, lows = self.find_swing_points(df)
         
         # Find round numbers if enabled
-        round_numbers = []
+        round_numbers = ()
         if self.include_round_numbers:
             price_range = (float(df['low'].min()) * 0.95, float(df['high'].max()) * 1.05)
             round_numbers = self.find_round_numbers(price_range)
         
         # Separate into support and resistance based on current price
-        resistance_levels = []
-        support_levels = []
+        resistance_parts = []
+        support_parts = []
+        
+        # Clustered levels and round numbers both come out in ascending price
+        # order, so the current price splits each with one searchsorted
         
         # Process swing highs as resistance
         if highs:
-            clustered_highs = self.cluster_levels(highs, atr)
-            for level in clustered_highs:
-                if level['price'] > current_price and level['touches'] >= self.min_touches:
-                    resistance_levels.append(SimpleSRLevel(
-                        price=level['price'],
-                        type='resistance',
-                        touches=level['touches'],
-                        first_seen=level.get('first_seen'),
-                        last_seen=level.get('last_seen'),
-                        is_round_number=False
-                    ))
+            clustered_highs = self.level_array(self.cluster_levels(highs, atr))
+            split = np.searchsorted(clustered_highs['price'], current_price, 'right')
+            above = clustered_highs[split:]
+            resistance_parts.append(above[above['touches'] >= self.min_touches])
         
         # Process swing lows as support
         if lows:
-            clustered_lows = self.cluster_levels(lows, atr)
-            for level in clustered_lows:
-                if level['price'] < current_price and level['touches'] >= self.min_touches:
-                    support_levels.append(SimpleSRLevel(
-                        price=level['price'],
-                        type='support',
-                        touches=level['touches'],
-                        first_seen=level.get('first_seen'),
-                        last_seen=level.get('last_seen'),
-                        is_round_number=False
-                    ))
+            clustered_lows = self.level_array(self.cluster_levels(lows, atr))
+            split = np.searchsorted(clustered_lows['price'], current_price, 'left')
+            below = clustered_lows[:split]
+            support_parts.append(below[below['touches'] >= self.min_touches])
         
         # Add round numbers
-        for round_price in round_numbers:
-            touches = self.count_touches(df, round_price, atr)
-            
-            if touches >= self.min_touches:
-                level = SimpleSRLevel(
-                    price=round_price,
-                    type='resistance' if round_price > current_price else 'support',
-                    touches=touches,
-                    first_seen=df.index[0],
-                    last_seen=df.index[-1],
-                    is_round_number=True
-                )
-                
-                if round_price > current_price:
-                    resistance_levels.append(level)
-                else:
-                    support_levels.append(level)
-        
-        # Sort by distance from current price and touches
-        resistance_levels.sort(key=lambda x: (x.price - current_price, -x.touches))
-        support_levels.sort(key=lambda x: (current_price - x.price, -x.touches))
+        if round_numbers:
+            rounds = np.empty(len(round_numbers), dtype=SR_LEVEL_DTYPE)
+            rounds['price'] = round_numbers
+            rounds['touches'] = self.count_touches_many(df, round_numbers, atr)
+            rounds['is_round_number'] = True
+            rounds['first_seen'] = [df.index[0]] * len(rounds)
+            rounds['last_seen'] = [df.index[-1]] * len(rounds)
+            rounds = rounds[rounds['touches'] >= self.min_touches]
+            split = np.searchsorted(rounds['price'], current_price, 'right')
+            resistance_parts.append(rounds[split:])
+            support_parts.append(rounds[:split])
+        
+        resistance = np.concatenate(resistance_parts) if resistance_parts else np.empty(0, dtype=SR_LEVEL_DTYPE)
+        support = np.concatenate(support_parts) if support_parts else np.empty(0, dtype=SR_LEVEL_DTYPE)
+        
+        # Sort by distance from current price and touches (lexsort's last key is primary)
+        resistance = resistance[np.lexsort((-resistance['touches'], resistance['price'] - current_price))]
+        support = support[np.lexsort((-support['touches'], current_price - support['price']))]
         
         # Return only top N levels
-        return (support_levels[:max_support], 
-                resistance_levels[:max_resistance])
+        return ([self.to_sr_level(row, 'support') for row in support[:max_support]],
+                [self.to_sr_level(row, 'resistance') for row in resistance[:max_resistance]])
+    
+    def level_array(self, levels: List[dict]) -> np.ndarray:
+        """Clustered level dicts as an SR_LEVEL_DTYPE array"""
+        arr = np.empty(len(levels), dtype=SR_LEVEL_DTYPE)
+        arr['price'] = [level['price'] for level in levels]
+        arr['touches'] = [level['touches'] for level in levels]
+        arr['is_round_number'] = False
+        arr['first_seen'] = [level.get('first_seen') for level in levels]
+        arr['last_seen'] = [level.get('last_seen') for level in levels]
+        return arr
+    
+    def to_sr_level(self, row: np.void, level_type: str) -> SimpleSRLevel:
+        """Build the SimpleSRLevel for one SR_LEVEL_DTYPE row"""
+        return SimpleSRLevel(
+            price=float(row['price']),
+            type=level_type,
+            touches=int(row['touches']),
+            first_seen=row['first_seen'],
+            last_seen=row['last_seen'],
+            is_round_number=bool(row['is_round_number'])
+        )
     
     def get_sr_summary(self, df: pd.DataFrame) -> dict:
         """Get a simple summary of S/R levels"""
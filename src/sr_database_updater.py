@@ -4,8 +4,11 @@ S/R Database Updater - Calculates and stores support/resistance levels in databa
 Uses the SimpleSRDetector for actual S/R detection
 """
 
+import io
+import csv
 import psycopg2
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import logging
 import os
@@ -38,12 +41,17 @@ class SRDatabaseUpdater:
         cur = self.conn.cursor()
         
         try:
+            # Pick the latest bars, but return them oldest first for analysis
             cur.execute("""
                 SELECT datetime, open, high, low, close, volume
-                FROM dhanhq.price_data
-                WHERE security_id = %s AND interval_minutes = %s
-                ORDER BY datetime DESC
-                LIMIT %s
+                FROM (
+                    SELECT datetime, open, high, low, close, volume
+                    FROM dhanhq.price_data
+                    WHERE security_id = %s AND interval_minutes = %s
+                    ORDER BY datetime DESC
+                    LIMIT %s
+                ) latest
+                ORDER BY datetime
             """, (self.security_id, interval_minutes, limit))
             
             rows = cur.fetchall()
@@ -51,9 +59,17 @@ class SRDatabaseUpdater:
             if not rows:
                 self.logger.warning(f"No data found for security {self.security_id}")
                 return None
-                
-            df = pd.DataFrame(rows, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-            df = df.sort_values('datetime')  # Sort ascending for analysis
+            
+            # Build typed columns directly rather than inferring per-cell objects
+            dt, o, h, l, c, v = zip(*rows)
+            df = pd.DataFrame({
+                'datetime': pd.DatetimeIndex(dt),
+                'open': np.array(o, dtype=np.float64),
+                'high': np.array(h, dtype=np.float64),
+                'low': np.array(l, dtype=np.float64),
+                'close': np.array(c, dtype=np.float64),
+                'volume': np.array(v, dtype=np.int64)
+            })
             
             return df
             
@@ -71,49 +87,29 @@ class SRDatabaseUpdater:
                 WHERE security_id = %s
             """, (self.security_id,))
             
-            # Insert support levels
-            for level in support_levels:
-                distance_pct = ((level.price - current_price) / current_price) * 100
-                
-                cur.execute("""
-                    INSERT INTO dhanhq.support_resistance_levels
-                    (security_id, symbol, level_type, price, touches, is_round_number,
-                     first_seen, last_seen, current_price, distance_percent)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    self.security_id,
-                    self.symbol,
-                    'support',
-                    float(level.price),
-                    level.touches,
-                    level.is_round_number,
-                    level.first_seen,
-                    level.last_seen,
-                    float(current_price),
-                    float(distance_pct)
-                ))
-            
-            # Insert resistance levels
-            for level in resistance_levels:
-                distance_pct = ((level.price - current_price) / current_price) * 100
-                
-                cur.execute("""
-                    INSERT INTO dhanhq.support_resistance_levels
-                    (security_id, symbol, level_type, price, touches, is_round_number,
-                     first_seen, last_seen, current_price, distance_percent)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    self.security_id,
-                    self.symbol,
-                    'resistance',
-                    float(level.price),
-                    level.touches,
-                    level.is_round_number,
-                    level.first_seen,
-                    level.last_seen,
-                    float(current_price),
-                    float(distance_pct)
-                ))
+            # Build all level rows; distances are computed column-wise
+            levels = [('support', level) for level in support_levels] + \
+                     [('resistance', level) for level in resistance_levels]
+            prices = np.array([level.price for _, level in levels], dtype=np.float64)
+            current_price = float(current_price)
+            distances = (prices - current_price) / current_price * 100.0
+            
+            rows = [
+                (self.security_id, self.symbol, level_type, price, int(level.touches),
+                 level.is_round_number, level.first_seen, level.last_seen, current_price, distance)
+                for (level_type, level), price, distance in zip(levels, prices.tolist(), distances.tolist())
+            ]
+            
+            # Stream the rows with COPY in the same transaction as the DELETE
+            buf = io.StringIO()
+            csv.writer(buf).writerows(rows)
+            buf.seek(0)
+            cur.copy_expert("""
+                COPY dhanhq.support_resistance_levels
+                (security_id, symbol, level_type, price, touches, is_round_number,
+                 first_seen, last_seen, current_price, distance_percent)
+                FROM STDIN WITH CSV
+            """, buf)
             
             self.conn.commit()
             
@@ -169,25 +165,27 @@ class SRDatabaseUpdater:
         cur = self.conn.cursor()
         
         try:
+            # Nearest three levels of each type, ranked in SQL
             cur.execute("""
-                SELECT level_type, price, touches, distance_percent
-                FROM dhanhq.support_resistance_levels
-                WHERE security_id = %s
-                ORDER BY level_type DESC, ABS(distance_percent) ASC
+                SELECT level_type, price
+                FROM (
+                    SELECT level_type, price,
+                           ROW_NUMBER() OVER (PARTITION BY level_type
+                                              ORDER BY ABS(distance_percent)) AS rn
+                    FROM dhanhq.support_resistance_levels
+                    WHERE security_id = %s
+                ) ranked
+                WHERE rn <= 3
+                ORDER BY level_type, rn
             """, (self.security_id,))
             
-            rows = cur.fetchall()
-            
             support = []
             resistance = []
             
-            for row in rows:
-                if row[0] == 'support':
-                    support.append(float(row[1]))
-                else:
-                    resistance.append(float(row[1]))
+            for level_type, price in cur.fetchall():
+                (support if level_type == 'support' else resistance).append(float(price))
             
-            return support[:3], resistance[:3]  # Return top 3 of each
+            return support, resistance
             
         finally:
             cur.close()
\ No newline at end of file
@@ -7,7 +7,115 @@ Calculates trends based on price action only
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import itertools
 import logging
+import weakref
+from psycopg2.extras import execute_values
+
+from .jit import njit, prange
+
+# Trend codes returned by ema_trend
+TREND_NAMES = ('NEUTRAL', 'UPTREND', 'DOWNTREND', 'SIDEWAYS')
+
+# Bars of context behind each backfilled trend
+TREND_CONTEXT_BARS = 50
+
+# Backfill reads, parsed and planned once per connection; parameter types
+# come from the compared columns
+BACKFILL_STATEMENTS = """
+    PREPARE missing_trend_dates AS
+    SELECT datetime 
+    FROM dhanhq.price_data 
+    WHERE security_id = $1 
+    AND interval_minutes = $2 
+    AND simple_trend IS NULL
+    ORDER BY datetime;
+    
+    PREPARE trend_close_series AS
+    SELECT datetime, close
+    FROM dhanhq.price_data
+    WHERE security_id = $1 
+    AND interval_minutes = $2
+    AND datetime <= $3
+    ORDER BY datetime;
+"""
+PREPARED_CONNS = weakref.WeakSet()
+
+
+@njit(cache=True)
+def ema_trend(close: np.ndarray):
+    """Classify the last bar of `close` against its 3/8/20 EMAs
+    
+    Returns:
+        Tuple of (index into TREND_NAMES, strength)
+    """
+    n = len(close)
+    if n < 20:
+        return 0, 0.0
+    
+    # Running EMAs (adjust=False); only the final values are needed
+    a3 = 2.0 / 4.0
+    a8 = 2.0 / 9.0
+    a20 = 2.0 / 21.0
+    ema_3 = close[0]
+    ema_8 = close[0]
+    ema_20 = close[0]
+    for i in range(1, n):
+        x = close[i]
+        ema_3 = a3 * x + (1.0 - a3) * ema_3
+        ema_8 = a8 * x + (1.0 - a8) * ema_8
+        ema_20 = a20 * x + (1.0 - a20) * ema_20
+    
+    last = close[n - 1]
+    # Recent price action (last 5 bars)
+    first = close[n - 5]
+    price_change_pct = ((last - first) / first) * 100
+    
+    # Strong downtrend if price below all EMAs and declining
+    if last < ema_3 < ema_8 < ema_20 and price_change_pct < -1:
+        trend = 2
+        strength = abs((ema_20 - last) / ema_20) * 100
+    # Strong uptrend if price above all EMAs and rising
+    elif last > ema_3 > ema_8 > ema_20 and price_change_pct > 1:
+        trend = 1
+        strength = ((last - ema_20) / ema_20) * 100
+    # Weak downtrend if price below 8 and 20 EMA
+    elif last < ema_8 and last < ema_20:
+        trend = 2
+        strength = abs((ema_20 - last) / ema_20) * 100 * 0.7  # Lower strength
+    # Weak uptrend if price above 8 and 20 EMA
+    elif last > ema_8 and last > ema_20:
+        trend = 1
+        strength = ((last - ema_20) / ema_20) * 100 * 0.7  # Lower strength
+    else:
+        trend = 3
+        strength = abs((last - ema_20) / ema_20) * 100
+    
+    return trend, min(strength, 100.0)
+
+
+@njit(parallel=True, cache=True)
+def window_trends(close: np.ndarray, positions: np.ndarray, first: np.ndarray, window: int):
+    """Run ema_trend on the `window` bars ending at each of `positions`
+    
+    Args:
+        close: Closes of one or more series laid end to end
+        positions: Index of each bar to evaluate
+        first: Index where each position's series starts; windows never cross it
+        window: Bars of context per evaluation
+    """
+    codes = np.zeros(len(positions), dtype=np.int64)
+    strengths = np.zeros(len(positions), dtype=np.float64)
+    
+    # Every evaluation is independent, so they spread across cores
+    for j in prange(len(positions)):
+        end = positions[j] + 1
+        trend, strength = ema_trend(close[max(first[j], end - window):end])
+        codes[j] = trend
+        strengths[j] = strength
+    
+    return codes, strengths
+
 
 class SimpleTrendDetector:
     def __init__(self, conn):
@@ -20,48 +128,64 @@ class SimpleTrendDetector:
         Calculate simple trend based on price action
         Returns: trend direction and strength
         """
-        if len(df) < 20:
-            return 'NEUTRAL', 0.0
+        trend, strength = ema_trend(df['close'].to_numpy(dtype=np.float64))
+        return TREND_NAMES[trend], float(strength)
+    
+    def prepare_statements(self):
+        """Define the backfill reads once per connection"""
+        if self.conn in PREPARED_CONNS:
+            return
+        
+        with self.conn.cursor() as cur:
+            cur.execute(BACKFILL_STATEMENTS)
+        PREPARED_CONNS.add(self.conn)
+    
+    def backfill_trends(self, series, missing_dates):
+        """Trend for each missing date from the bars leading up to it
+        
+        Args:
+            series: Ascending (date, close) rows
+            missing_dates: Dates to calculate trends for
+            
+        Returns:
+            List of (date, trend, strength)
+        """
+        return self.backfill_trends_many([(series, missing_dates)])[0]
+    
+    def backfill_trends_many(self, batches):
+        """backfill_trends for several series in a single kernel call
+        
+        Args:
+            batches: List of (series, missing_dates) pairs
             
-        # Calculate EMAs with more responsive settings
-        df['ema_3'] = df['close'].ewm(span=3, adjust=False).mean()
-        df['ema_8'] = df['close'].ewm(span=8, adjust=False).mean()
-        df['ema_20'] = df['close'].ewm(span=20, adjust=False).mean()
+        Returns:
+            List with one list of (date, trend, strength) per batch
+        """
+        dates = []
+        closes = []
+        positions = []
+        first = []
+        counts = []
         
-        # Get latest values
-        latest = df.iloc[-1]
-        close = latest['close']
-        ema_3 = latest['ema_3']
-        ema_8 = latest['ema_8']
-        ema_20 = latest['ema_20']
+        for series, missing_dates in batches:
+            missing = set(missing_dates)
+            offset = len(dates)
+            found = [offset + i for i, row in enumerate(series) if row[0] in missing]
+            dates.extend(row[0] for row in series)
+            closes.append(np.fromiter((row[1] for row in series), dtype=np.float64, count=len(series)))
+            positions.extend(found)
+            first.extend([offset] * len(found))
+            counts.append(len(found))
         
-        # Also check recent price action (last 5 bars)
-        recent_prices = df['close'].tail(5)
-        price_trend = recent_prices.iloc[-1] - recent_prices.iloc[0]
-        price_change_pct = (price_trend / recent_prices.iloc[0]) * 100
+        codes, strengths = window_trends(np.concatenate(closes) if closes else np.empty(0),
+                                         np.array(positions, dtype=np.int64),
+                                         np.array(first, dtype=np.int64),
+                                         TREND_CONTEXT_BARS)
+        rows = [(dates[i], TREND_NAMES[code], float(strength))
+                for i, code, strength in zip(positions, codes.tolist(), strengths.tolist())]
         
-        # More responsive trend detection
-        # Strong downtrend if price below all EMAs and declining
-        if close < ema_3 < ema_8 < ema_20 and price_change_pct < -1:
-            trend = 'DOWNTREND'
-            strength = abs((ema_20 - close) / ema_20) * 100
-        # Strong uptrend if price above all EMAs and rising  
-        elif close > ema_3 > ema_8 > ema_20 and price_change_pct > 1:
-            trend = 'UPTREND'
-            strength = ((close - ema_20) / ema_20) * 100
-        # Weak downtrend if price below 8 and 20 EMA
-        elif close < ema_8 and close < ema_20:
-            trend = 'DOWNTREND'
-            strength = abs((ema_20 - close) / ema_20) * 100 * 0.7  # Lower strength
-        # Weak uptrend if price above 8 and 20 EMA
-        elif close > ema_8 and close > ema_20:
-            trend = 'UPTREND'
-            strength = ((close - ema_20) / ema_20) * 100 * 0.7  # Lower strength
-        else:
-            trend = 'SIDEWAYS'
-            strength = abs((close - ema_20) / ema_20) * 100
-            
-        return trend, min(strength, 100.0)
+        bounds = list(itertools.accumulate(counts, initial=0))
+        return [rows[a:b] for a, b in zip(bounds, bounds[1:])]
     
     def update_missing_trends(self, security_id, interval_minutes):
         """Update trends only for records where simple_trend is NULL"""
@@ -69,71 +193,89 @@ class SimpleTrendDetector:
         updated_count = 0
         
         try:
+            self.prepare_statements()
+            
             # Get records with missing trends
-            cur.execute("""
-                SELECT datetime 
-                FROM dhanhq.price_data 
-                WHERE security_id = %s 
-                AND interval_minutes = %s 
-                AND simple_trend IS NULL
-                ORDER BY datetime
-            """, (security_id, interval_minutes))
+            cur.execute("EXECUTE missing_trend_dates (%s, %s)", (security_id, interval_minutes))
             
             missing_dates = [row[0] for row in cur.fetchall()]
             
             if not missing_dates:
                 return 0
             
-            # Process in batches
-            for target_date in missing_dates:
-                # Get 50 records before target date for context
-                cur.execute("""
-                    SELECT datetime, open, high, low, close, volume
-                    FROM dhanhq.price_data
-                    WHERE security_id = %s 
-                    AND interval_minutes = %s
-                    AND datetime <= %s
-                    ORDER BY datetime DESC
-                    LIMIT 50
-                """, (security_id, interval_minutes, target_date))
-                
-                rows = cur.fetchall()
+            # One pass over the closes up to the last missing bar
+            cur.execute("EXECUTE trend_close_series (%s, %s, %s)",
+                        (security_id, interval_minutes, missing_dates[-1]))
+            
+            rows = self.backfill_trends(cur.fetchall(), missing_dates)
+            
+            execute_values(cur, """
+                UPDATE dhanhq.price_data AS p
+                SET simple_trend = v.trend,
+                    simple_trend_strength = v.strength
+                FROM (VALUES %s) AS v(security_id, interval_minutes, datetime, trend, strength)
+                WHERE p.security_id = v.security_id
+                AND p.interval_minutes = v.interval_minutes
+                AND p.datetime = v.datetime
+            """, [(security_id, interval_minutes, *row) for row in rows], page_size=1000)
+            
+            updated_count = len(rows)
+            self.conn.commit()
+            
+        except Exception as e:
+            self.conn.rollback()
+            self.logger.error(f"Error updating trends: {e}")
+            raise
+        
+        return updated_count
+    
+    def update_missing_trends_many(self, series_keys):
+        """update_missing_trends for several series with one kernel call and one commit
+        
+        Args:
+            series_keys: (security_id, interval_minutes) pairs to backfill
+            
+        Returns:
+            Dict of updated row counts per (security_id, interval_minutes)
+        """
+        cur = self.conn.cursor()
+        updated = {key: 0 for key in series_keys}
+        
+        try:
+            self.prepare_statements()
+            
+            batches = []
+            for security_id, interval_minutes in series_keys:
+                cur.execute("EXECUTE missing_trend_dates (%s, %s)", (security_id, interval_minutes))
                 
-                if len(rows) < 20:
-                    # Not enough data for trend calculation
-                    cur.execute("""
-                        UPDATE dhanhq.price_data
-                        SET simple_trend = 'NEUTRAL',
-                            simple_trend_strength = 0
-                        WHERE security_id = %s 
-                        AND interval_minutes = %s
-                        AND datetime = %s
-                    """, (security_id, interval_minutes, target_date))
-                else:
-                    # Create DataFrame and calculate trend
-                    df = pd.DataFrame(rows, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-                    df = df.sort_values('datetime')
-                    df['close'] = df['close'].astype(float)
-                    
-                    trend, strength = self.calculate_simple_trend(df)
-                    
-                    # Update the specific record
-                    cur.execute("""
-                        UPDATE dhanhq.price_data
-                        SET simple_trend = %s,
-                            simple_trend_strength = %s
-                        WHERE security_id = %s 
-                        AND interval_minutes = %s
-                        AND datetime = %s
-                    """, (trend, float(strength), security_id, interval_minutes, target_date))
+                missing_dates = [row[0] for row in cur.fetchall()]
+                if not missing_dates:
+                    continue
                 
-                updated_count += cur.rowcount
+                cur.execute("EXECUTE trend_close_series (%s, %s, %s)",
+                            (security_id, interval_minutes, missing_dates[-1]))
                 
-                # Commit every 100 records
-                if updated_count % 100 == 0:
-                    self.conn.commit()
+                batches.append(((security_id, interval_minutes), cur.fetchall(), missing_dates))
+            
+            if not batches:
+                return updated
+            
+            results = self.backfill_trends_many([(series, missing) for _, series, missing in batches])
+            rows = []
+            for (key, _, _), trends in zip(batches, results):
+                rows.extend((*key, *row) for row in trends)
+                updated[key] = len(trends)
+            
+            execute_values(cur, """
+                UPDATE dhanhq.price_data AS p
+                SET simple_trend = v.trend,
+                    simple_trend_strength = v.strength
+                FROM (VALUES %s) AS v(security_id, interval_minutes, datetime, trend, strength)
+                WHERE p.security_id = v.security_id
+                AND p.interval_minutes = v.interval_minutes
+                AND p.datetime = v.datetime
+            """, rows, page_size=1000)
             
-            # Final commit
             self.conn.commit()
             
         except Exception as e:
@@ -141,7 +283,7 @@ class SimpleTrendDetector:
             self.logger.error(f"Error updating trends: {e}")
             raise
         
-        return updated_count
+        return updated
     
     def update_missing_daily_trends(self, security_id):
         """Update trends only for daily records where simple_trend is NULL"""
@@ -163,47 +305,27 @@ class SimpleTrendDetector:
             if not missing_dates:
                 return 0
             
-            # Process each date
-            for target_date in missing_dates:
-                # Get 50 records before target date for context
-                cur.execute("""
-                    SELECT date, open, high, low, close, volume
-                    FROM dhanhq.price_data_daily
-                    WHERE security_id = %s 
-                    AND date <= %s
-                    ORDER BY date DESC
-                    LIMIT 50
-                """, (security_id, target_date))
-                
-                rows = cur.fetchall()
-                
-                if len(rows) < 20:
-                    # Not enough data for trend calculation
-                    cur.execute("""
-                        UPDATE dhanhq.price_data_daily
-                        SET simple_trend = 'NEUTRAL',
-                            simple_trend_strength = 0
-                        WHERE security_id = %s 
-                        AND date = %s
-                    """, (security_id, target_date))
-                else:
-                    # Create DataFrame and calculate trend
-                    df = pd.DataFrame(rows, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-                    df = df.sort_values('datetime')
-                    df['close'] = df['close'].astype(float)
-                    
-                    trend, strength = self.calculate_simple_trend(df)
-                    
-                    # Update the specific record
-                    cur.execute("""
-                        UPDATE dhanhq.price_data_daily
-                        SET simple_trend = %s,
-                            simple_trend_strength = %s
-                        WHERE security_id = %s 
-                        AND date = %s
-                    """, (trend, float(strength), security_id, target_date))
-                
-                updated_count += cur.rowcount
+            # One pass over the closes up to the last missing day
+            cur.execute("""
+                SELECT date, close
+                FROM dhanhq.price_data_daily
+                WHERE security_id = %s 
+                AND date <= %s
+                ORDER BY date
+            """, (security_id, missing_dates[-1]))
+            
+            rows = self.backfill_trends(cur.fetchall(), missing_dates)
+            
+            execute_values(cur, """
+                UPDATE dhanhq.price_data_daily AS p
+                SET simple_trend = v.trend,
+                    simple_trend_strength = v.strength
+                FROM (VALUES %s) AS v(security_id, date, trend, strength)
+                WHERE p.security_id = v.security_id
+                AND p.date = v.date
+            """, [(security_id, *row) for row in rows], page_size=1000)
+            
+            updated_count = len(rows)
             
             # Commit all changes
             self.conn.commit()
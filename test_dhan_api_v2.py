@@ -90,12 +90,16 @@ def test_intraday_api():
     print(f"Date range: {from_date.strftime('%Y-%m-%d')} to {to_date.strftime('%Y-%m-%d')}")
     print("="*60)
     
+    # One keep-alive connection for every test case
+    session = requests.Session()
+    session.headers.update(headers)
+    
     for test in test_cases:
         print(f"\n{test['name']}")
         print(f"Payload: {json.dumps(test['payload'], indent=2)}")
         
         try:
-            response = requests.post(url, headers=headers, json=test['payload'])
+            response = session.post(url, json=test['payload'])
             
             print(f"Status Code: {response.status_code}")
             
@@ -117,6 +121,8 @@ def test_intraday_api():
             print(f"❌ Exception: {e}")
         
         print("-"*40)
+    
+    session.close()
 
 def test_historical_api():
     """Test the historical API endpoint"""
@@ -6,60 +6,70 @@ Test script to verify all system components
 import requests
 import json
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 BASE_URL = "http://localhost:5001"
 
-def test_dashboard():
+def test_dashboard(session):
     """Test main dashboard"""
-    print("Testing Dashboard...")
-    response = requests.get(f"{BASE_URL}/")
+    report = ["Testing Dashboard..."]
+    response = session.get(f"{BASE_URL}/")
     if response.status_code == 200 and "MANKIND" in response.text:
-        print("✓ Dashboard is accessible")
+        report.append("✓ Dashboard is accessible")
     else:
-        print("✗ Dashboard failed")
+        report.append("✗ Dashboard failed")
+    return report
     
-def test_admin_panel():
+def test_admin_panel(session):
     """Test admin panel"""
-    print("\nTesting Admin Panel...")
-    response = requests.get(f"{BASE_URL}/admin")
+    report = ["\nTesting Admin Panel..."]
+    response = session.get(f"{BASE_URL}/admin")
     if response.status_code == 200 and "Admin Panel" in response.text:
-        print("✓ Admin panel is accessible")
+        report.append("✓ Admin panel is accessible")
     else:
-        print("✗ Admin panel failed")
+        report.append("✗ Admin panel failed")
+    return report
 
-def test_recommendations_page():
+def test_recommendations_page(session):
     """Test recommendations page"""
-    print("\nTesting Recommendations Page...")
-    response = requests.get(f"{BASE_URL}/recommendations")
+    report = ["\nTesting Recommendations Page..."]
+    response = session.get(f"{BASE_URL}/recommendations")
     if response.status_code == 200 and "Trading Recommendations" in response.text:
-        print("✓ Recommendations page is accessible")
+        report.append("✓ Recommendations page is accessible")
     else:
-        print("✗ Recommendations page failed")
+        report.append("✗ Recommendations page failed")
+    return report
 
-def test_api_endpoints():
+def test_api_endpoints(session):
     """Test API endpoints"""
-    print("\nTesting API Endpoints...")
+    report = ["\nTesting API Endpoints..."]
     
     # Test dashboard data API
-    response = requests.get(f"{BASE_URL}/api/dashboard-data")
+    response = session.get(f"{BASE_URL}/api/dashboard-data")
     if response.status_code == 200:
         data = response.json()
         if 'current_price' in data:
-            print(f"✓ Dashboard API working - Current Price: ₹{data['current_price']}")
+            report.append(f"✓ Dashboard API working - Current Price: ₹{data['current_price']}")
         else:
-            print("✗ Dashboard API returned incomplete data")
+            report.append("✗ Dashboard API returned incomplete data")
     else:
-        print("✗ Dashboard API failed")
+        report.append("✗ Dashboard API failed")
     
     # Test database status API
-    response = requests.get(f"{BASE_URL}/api/database-status")
+    response = session.get(f"{BASE_URL}/api/database-status")
     if response.status_code == 200:
         data = response.json()
-        print("✓ Database Status API working")
+        report.append("✓ Database Status API working")
         for timeframe, info in data.items():
-            print(f"  - {timeframe}: {info['count']} records, {info['coverage']}% coverage")
+            report.append(f"  - {timeframe}: {info['count']} records, {info['coverage']}% coverage")
     else:
-        print("✗ Database Status API failed")
+        report.append("✗ Database Status API failed")
+    return report
+
+def run_test(test):
+    """Run one check on its own session; sessions are not shared across threads"""
+    with requests.Session() as session:
+        return test(session)
 
 def main():
     print("="*60)
@@ -69,10 +79,11 @@ def main():
     print(f"Testing URL: {BASE_URL}")
     print("="*60)
     
-    test_dashboard()
-    test_admin_panel()
-    test_recommendations_page()
-    test_api_endpoints()
+    # Checks are independent, so run them concurrently and print in order
+    tests = [test_dashboard, test_admin_panel, test_recommendations_page, test_api_endpoints]
+    with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+        for report in executor.map(run_test, tests):
+            print("\n".join(report))
     
     print("\n" + "="*60)
     print("TEST SUMMARY")